@@ -0,0 +1,324 @@
+import asyncio
+import json
+import time
+
+from collections import Counter, OrderedDict
+
+from redis.exceptions import RedisError
+
+from app.core.config import CACHE_LOCAL_SIZE, CACHE_TTL_SECONDS
+from app.core.redis import get_pubsub_redis, get_redis
+
+
+INVALIDATION_CHANNEL = "cache-invalidation"
+
+
+class TTLCache:
+    """
+    bounded in-process LRU cache whose entries expire after a ttl.
+
+    generation is bumped on every invalidation, a value read from the database
+    before an invalidation is not stored (see set), so a slow reader can not put
+    a stale entry back into the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None, generation: int | None = None):
+        if generation is not None and generation != self.generation:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheInvalidator:
+    """
+    evicts keys from the registered in-process caches of every worker.
+
+    invalidate removes the key locally and publishes "<cache name>:<key>" on
+    redis, listen (started in the app lifespan) applies the messages published
+    by the other workers.
+
+    a cache is anything with pop(key) and clear(), usually a TTLCache.
+    """
+
+    def __init__(self, channel: str = INVALIDATION_CHANNEL):
+        self.channel = channel
+        self.caches = {}
+        # seconds between reconnection attempts of listen
+        self.retry_seconds = 1
+
+    def register(self, name: str, cache):
+        self.caches[name] = cache
+
+    def evict(self, name: str, key: str):
+        cache = self.caches.get(name)
+        if cache is not None:
+            cache.pop(key)
+
+    def clear_all(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+    async def invalidate(self, name: str, key):
+        key = str(key)
+        self.evict(name, key)
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.publish(self.channel, f"{name}:{key}")
+        except RedisError:
+            # the other workers fall back to the ttl of their entries
+            pass
+
+    async def listen(self):
+        redis = get_pubsub_redis()
+        if redis is None:
+            return
+        while True:
+            subscribed = False
+            try:
+                # the pubsub connection is released on every exit
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    subscribed = True
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        name, _, key = message["data"].partition(":")
+                        self.evict(name, key)
+            except asyncio.CancelledError:
+                raise
+            except RedisError:
+                if subscribed:
+                    # invalidations may have been missed while disconnected
+                    self.clear_all()
+                await asyncio.sleep(self.retry_seconds)
+
+
+cache_invalidator = CacheInvalidator()
+
+
+# stores a value only if the generation of its key is still the one read before
+# loading it, a delete in between (INCR of the generation) makes the write a no-op
+GUARDED_SET_LUA = """
+local generation = tonumber(redis.call("GET", KEYS[2]) or "0")
+if generation ~= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2])
+return 1
+"""
+
+# generation returned when it can not be read: it matches no key, nothing is stored
+UNKNOWN_GENERATION = -1
+
+
+class ReadThroughCache:
+    """
+    json documents shared by the workers in redis. without redis (tests, local runs)
+    they are kept in an in-process TTLCache. redis errors count as misses, so the
+    database keeps answering when redis is down.
+
+    keys look like "<resource>:<id>[:<sub resource>]", hits and misses are counted
+    per resource.
+
+    every delete bumps the generation of its keys. a reader takes the generations
+    of its misses before loading them and passes them to set, so a value read
+    before a concurrent update is not stored over the invalidation:
+
+        document = await read_cache.get(key)
+        if document is None:
+            generation = await read_cache.generation(key)
+            document = await load()
+            await read_cache.set(key, document, generation=generation)
+    """
+
+    def __init__(self, namespace: str = "cache", ttl: int = CACHE_TTL_SECONDS, local_maxsize: int = CACHE_LOCAL_SIZE):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=local_maxsize, ttl=ttl)
+        self.script = None
+        self.hits = Counter()
+        self.misses = Counter()
+        self.errors = 0
+
+    def redis_key(self, key: str) -> str:
+        # the hash tag keeps a value and its generation on the same cluster slot
+        return f"{self.namespace}:{{{key}}}"
+
+    def generation_key(self, key: str) -> str:
+        return f"{self.namespace}:{{{key}}}:generation"
+
+    def count(self, key: str, hit: bool):
+        resource = key.split(":", 1)[0]
+        if hit:
+            self.hits[resource] += 1
+        else:
+            self.misses[resource] += 1
+
+    async def get(self, key: str):
+        redis = get_redis()
+        if redis is None:
+            raw = self.local.get(key)
+        else:
+            try:
+                raw = await redis.get(self.redis_key(key))
+            except RedisError:
+                self.errors += 1
+                raw = None
+        self.count(key, raw is not None)
+        return None if raw is None else json.loads(raw)
+
+    async def get_many(self, keys: list[str]) -> list:
+        """
+        values of keys in order (None on a miss), one MGET on redis
+        """
+        if not keys:
+            return []
+        redis = get_redis()
+        if redis is None:
+            raws = [self.local.get(key) for key in keys]
+        else:
+            try:
+                raws = await redis.mget([self.redis_key(key) for key in keys])
+            except RedisError:
+                self.errors += 1
+                raws = [None] * len(keys)
+        for key, raw in zip(keys, raws):
+            self.count(key, raw is not None)
+        return [None if raw is None else json.loads(raw) for raw in raws]
+
+    async def generation(self, key: str) -> int:
+        return (await self.generations([key]))[key]
+
+    async def generations(self, keys: list[str]) -> dict[str, int]:
+        """
+        generation of each key, read before loading the misses (one MGET on redis)
+        """
+        redis = get_redis()
+        if redis is None:
+            return { key: self.local.generation for key in keys }
+        if not keys:
+            return {}
+        try:
+            raws = await redis.mget([self.generation_key(key) for key in keys])
+        except RedisError:
+            self.errors += 1
+            return { key: UNKNOWN_GENERATION for key in keys }
+        return { key: int(raw or 0) for key, raw in zip(keys, raws) }
+
+    def guarded_set(self, redis):
+        if self.script is None:
+            self.script = redis.register_script(GUARDED_SET_LUA)
+        return self.script
+
+    async def set(self, key: str, value, generation: int | None = None):
+        raw = json.dumps(value, separators=(",", ":"))
+        redis = get_redis()
+        if redis is None:
+            self.local.set(key, raw, generation=generation)
+            return
+        try:
+            if generation is None:
+                await redis.set(self.redis_key(key), raw, ex=self.ttl)
+            else:
+                await self.guarded_set(redis)(
+                    keys=[self.redis_key(key), self.generation_key(key)], args=[raw, self.ttl, generation])
+        except RedisError:
+            self.errors += 1
+
+    async def set_many(self, values: dict, generations: dict[str, int] | None = None):
+        """
+        stores every key of values, one pipelined round trip on redis. with
+        generations (see generations) a key deleted since then is not stored
+        """
+        if not values:
+            return
+        raws = { key: json.dumps(value, separators=(",", ":")) for key, value in values.items() }
+        redis = get_redis()
+        if redis is None:
+            for key, raw in raws.items():
+                self.local.set(key, raw, generation=None if generations is None else generations[key])
+            return
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, raw in raws.items():
+                    if generations is None:
+                        pipe.set(self.redis_key(key), raw, ex=self.ttl)
+                    else:
+                        await self.guarded_set(redis)(
+                            keys=[self.redis_key(key), self.generation_key(key)],
+                            args=[raw, self.ttl, generations[key]],
+                            client=pipe)
+                await pipe.execute()
+        except RedisError:
+            self.errors += 1
+
+    async def delete(self, *keys: str):
+        redis = get_redis()
+        if redis is None:
+            for key in keys:
+                self.local.pop(key)
+            return
+        try:
+            # the generation outlives every value stored with the previous one
+            async with redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.delete(self.redis_key(key))
+                    pipe.incr(self.generation_key(key))
+                    pipe.expire(self.generation_key(key), self.ttl)
+                await pipe.execute()
+        except RedisError:
+            # the entries expire with their ttl
+            self.errors += 1
+
+    def stats(self) -> dict:
+        resources = sorted(set(self.hits) | set(self.misses))
+        return {
+            "backend": "redis" if get_redis() is not None else "local",
+            "errors": self.errors,
+            "resources": {
+                resource: {
+                    "hits": self.hits[resource],
+                    "misses": self.misses[resource],
+                    "hit_ratio": round(self.hits[resource] / ((self.hits[resource] + self.misses[resource]) or 1), 3),
+                }
+                for resource in resources
+            },
+        }
+
+
+read_cache = ReadThroughCache()
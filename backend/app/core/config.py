@@ -13,11 +13,34 @@ DATABASE_URL = (
     f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 )
 
+# async driver url used by the application engine (asyncpg), can be overridden
+# e.g. "sqlite+aiosqlite:///./test.db" to run the tests without postgres
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL", DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1))
+
+# connection pool (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds waiting for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# connections all the workers of python -m app.server may open together (0: use
+# DB_POOL_SIZE and DB_MAX_OVERFLOW as they are), split into a pool per worker
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 0))
+# migrations are applied by python -m app.manage migrate, the workers only check them
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 HASH_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# password hashing runs in a dedicated thread pool, this is its concurrency limit
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+
+# verified access tokens kept in memory (per worker), entries expire with the token
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+
 SUPERUSER_USERNAME = os.getenv("SUPERUSER_USERNAME")
 SUPERUSER_PASSWORD = os.getenv("SUPERUSER_PASSWORD")
 
@@ -30,11 +53,57 @@ CORS_HEADERS = os.getenv("CORS_HEADERS")
 TOKEN_EXPIRED_TIME_MINUTES = os.getenv("TOKEN_EXPIRED_TIME_MINUTES", 60)
 
 
+# python -m app.server, WEB_CONCURRENCY=0 starts one worker per cpu
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
+SERVER_WORKERS = int(os.getenv("WEB_CONCURRENCY", 0))
+# seconds the workers get to finish the requests in flight on shutdown
+SERVER_GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("SERVER_GRACEFUL_SHUTDOWN_SECONDS", 30))
+# addresses of the reverse proxies / load balancers whose X-Forwarded-For and
+# X-Forwarded-Proto are trusted (comma separated ips or cidrs, "*" for any).
+# the client ip (rate limits of anonymous callers and logins) comes from them
+SERVER_FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+
 REDIS_PORT = os.getenv("REDIS_PORT")
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 
 
 REDIS_URI = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/0"
+# a slow redis fails fast, the cache and the rate limiter go on without it
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", 0.5))
+
+# authenticated users cache of get_current_user (per worker)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 1024))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+
+# an unknown priority or status reloads its dimension table at most this often
+DIMENSION_RELOAD_SECONDS = float(os.getenv("DIMENSION_RELOAD_SECONDS", 5))
+
+# read-through cache of task, comments and user reads (redis, in-process without redis)
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 300))
+CACHE_LOCAL_SIZE = int(os.getenv("CACHE_LOCAL_SIZE", 10000))
+
+# maximum number of items of a bulk task request
+TASK_BULK_MAX_ITEMS = int(os.getenv("TASK_BULK_MAX_ITEMS", 5000))
+
+# rows fetched per round trip by the server-side cursor of GET /tasks/export
+TASK_EXPORT_CHUNK_SIZE = int(os.getenv("TASK_EXPORT_CHUNK_SIZE", 1000))
+
+# rows validated and loaded per transaction by POST /tasks/import
+TASK_IMPORT_CHUNK_SIZE = int(os.getenv("TASK_IMPORT_CHUNK_SIZE", 1000))
+
+# maximum number of ids of a multi-get (GET/POST /tasks/by-ids, /users/by-ids)
+MULTI_GET_MAX_IDS = int(os.getenv("MULTI_GET_MAX_IDS", 500))
 
-REQUEST_RATE_LIMIT_MINUTE = os.getenv("REQUEST_RATE_LIMIT_MINUTE", 600)
+REQUEST_RATE_LIMIT_MINUTE = int(os.getenv("REQUEST_RATE_LIMIT_MINUTE", 600))
+# own quotas (per identity and route) of logins and of the expensive task routes
+RATE_LIMIT_LOGIN_MINUTE = int(os.getenv("RATE_LIMIT_LOGIN_MINUTE", 60))
+RATE_LIMIT_EXPENSIVE_MINUTE = int(os.getenv("RATE_LIMIT_EXPENSIVE_MINUTE", 30))
+# tokens a worker takes from the redis window at once and spends locally, and for how long
+RATE_LIMIT_LOCAL_BATCH = int(os.getenv("RATE_LIMIT_LOCAL_BATCH", 10))
+RATE_LIMIT_LEASE_SECONDS = float(os.getenv("RATE_LIMIT_LEASE_SECONDS", 1))
+RATE_LIMIT_LOCAL_SIZE = int(os.getenv("RATE_LIMIT_LOCAL_SIZE", 10000))
+# requests are let through without asking redis for this long after a redis error
+RATE_LIMIT_REDIS_RETRY_SECONDS = float(os.getenv("RATE_LIMIT_REDIS_RETRY_SECONDS", 5))
@@ -1,13 +1,18 @@
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import CORS_HEADERS, CORS_METHODS, CORS_ORIGINS
+from app.core.etag import ETAG_HEADER, IF_NONE_MATCH_HEADER
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.rate_limiter import RATE_LIMIT_LIMIT_HEADER, RATE_LIMIT_REMAINING_HEADER
 
 
 origins = [ "http://localhost", "http://localhost:8080", "http://frontend", "http://frontend:8080"] \
         if not CORS_ORIGINS else CORS_ORIGINS.split(",")
 
 methods = ["GET", "POST", "PUT", "DELETE"] if not CORS_METHODS else CORS_METHODS.split(",")
-headers = ["Authorization", "Content-Type"] if not CORS_HEADERS else CORS_HEADERS.split(",")
+headers = ["Authorization", "Content-Type", IF_NONE_MATCH_HEADER] if not CORS_HEADERS else CORS_HEADERS.split(",")
+# response headers readable by the browser
+expose_headers = [NEXT_CURSOR_HEADER, ETAG_HEADER, RATE_LIMIT_LIMIT_HEADER, RATE_LIMIT_REMAINING_HEADER, "Retry-After"]
 
 
 def add_cors_middleware(app):
@@ -17,4 +22,5 @@ def add_cors_middleware(app):
         allow_credentials=True,
         allow_methods=methods,
         allow_headers=headers,
+        expose_headers=expose_headers,
     )
@@ -0,0 +1,58 @@
+import hashlib
+
+from datetime import datetime, timezone
+
+from fastapi import Response
+
+from app.core.responses import response_headers
+
+
+ETAG_HEADER = "ETag"
+IF_NONE_MATCH_HEADER = "If-None-Match"
+
+
+def timestamp_token(value: datetime | str | None) -> str:
+    """
+    same token for an updated_at read from the database (naive utc) and for the
+    iso string of a cached response
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def make_etag(*parts) -> str:
+    """
+    strong etag (quoted) of the parts
+    """
+    raw = "\x1f".join(str(part) for part in parts).encode()
+    return f'"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    If-None-Match check, weak comparison as required for GET
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str, response: Response | None = None) -> Response:
+    """
+    304 for a matching If-None-Match, keeps the headers already set on response
+    (rate limit) as a 200 built with json_response does
+    """
+    return Response(status_code=304, headers={**response_headers(response), ETAG_HEADER: etag})
@@ -0,0 +1,46 @@
+import base64
+import json
+
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, tuple_
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key: str, values: list) -> str:
+    """
+    opaque cursor of a keyset page, key identifies the ordering the values belong to
+    """
+    data = [key, [v.isoformat() if isinstance(v, datetime) else v for v in values]]
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key: str, types: tuple) -> list:
+    """
+    values of a cursor made by encode_cursor, converted to types (400 when invalid)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_key, values = json.loads(raw)
+        if cursor_key != key or len(values) != len(types):
+            raise ValueError(cursor_key)
+        return [
+            datetime.fromisoformat(value) if value_type is datetime else value_type(value)
+            for value, value_type in zip(values, types)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_after(columns: list, values: list, descending: bool = False):
+    """
+    where clause selecting the rows after values for ORDER BY columns (same direction).
+    the redundant condition on the first column lets the planner use its index.
+    """
+    if descending:
+        return and_(columns[0] <= values[0], tuple_(*columns) < tuple_(*values))
+    return and_(columns[0] >= values[0], tuple_(*columns) > tuple_(*values))
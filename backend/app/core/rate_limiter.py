@@ -1,57 +1,336 @@
+import math
+import time
+
 from typing import Annotated
 
-import aioredis
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.security.utils import get_authorization_scheme_param
+from jwt.exceptions import InvalidTokenError
+from redis.exceptions import RedisError
+
+from app.core.cache import TTLCache
+from app.core.config import RATE_LIMIT_LEASE_SECONDS, RATE_LIMIT_LOCAL_BATCH, RATE_LIMIT_LOCAL_SIZE
+from app.core.config import RATE_LIMIT_REDIS_RETRY_SECONDS, REQUEST_RATE_LIMIT_MINUTE
+from app.core.redis import get_redis
+from app.core.security import decode_access_token
+
 
-from fastapi import Depends, Request, Response, HTTPException, status
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-from fastapi.responses import JSONResponse
+RATE_LIMIT_LIMIT_HEADER = "X-RateLimit-Limit"
+RATE_LIMIT_REMAINING_HEADER = "X-RateLimit-Remaining"
 
-from starlette.exceptions import HTTPException as StarletteHTTPException
+# sliding window counter: the count of the previous window weighs what is left of
+# it, e.g. 30% into the current window 70% of the previous count still applies.
+# grants up to requested tokens (at least cost) in one atomic step, after giving
+# back the unspent tokens of an expired lease to the window they were taken from.
+# returns {granted, remaining, retry after ms}
+SLIDING_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local requested = tonumber(ARGV[5])
+local current = tonumber(redis.call("GET", KEYS[1]) or "0")
+local previous = tonumber(redis.call("GET", KEYS[2]) or "0")
+local refund = math.min(tonumber(ARGV[6]), current)
+if refund > 0 then
+    current = redis.call("DECRBY", KEYS[1], refund)
+end
+refund = math.min(tonumber(ARGV[7]), previous)
+if refund > 0 then
+    previous = redis.call("DECRBY", KEYS[2], refund)
+end
+local available = math.floor(limit - previous * (window - elapsed) / window - current)
+if available < cost then
+    local retry = window - elapsed
+    if current + cost <= limit and previous > 0 then
+        retry = math.ceil(window * (1 - (limit - cost - current) / previous)) - elapsed
+    end
+    return {0, math.max(available, 0), math.max(retry, 1)}
+end
+local granted = math.min(requested, available)
+redis.call("INCRBY", KEYS[1], granted)
+redis.call("PEXPIRE", KEYS[1], window * 2)
+return {granted, available - granted, 0}
+"""
 
 
-from app.core.config import REDIS_URI, REQUEST_RATE_LIMIT_MINUTE
+def sliding_window(
+    counts: dict, limit: int, window_ms: int, now_ms: int, cost: int, requested: int,
+    refund_current: int = 0, refund_previous: int = 0,
+):
+    """
+    SLIDING_WINDOW_LUA on an in-process dict of window index -> count, used without redis
+    """
+    index, elapsed = divmod(now_ms, window_ms)
+    current = counts.get(index, 0)
+    previous = counts.get(index - 1, 0)
+    current -= min(refund_current, current)
+    previous -= min(refund_previous, previous)
+    for i, count in ((index, current), (index - 1, previous)):
+        if i in counts:
+            counts[i] = count
+    available = math.floor(limit - previous * (window_ms - elapsed) / window_ms - current)
+    if available < cost:
+        retry = window_ms - elapsed
+        if current + cost <= limit and previous > 0:
+            retry = math.ceil(window_ms * (1 - (limit - cost - current) / previous)) - elapsed
+        return 0, max(available, 0), max(retry, 1)
+    granted = min(requested, available)
+    counts[index] = current + granted
+    for old in [i for i in counts if i < index - 1]:
+        del counts[old]
+    return granted, available - granted, 0
 
 
-async def service_name_identifier(request: Request):
-    service = request.headers.get("Service-Name")
-    return service
+class RateLimitDecision:
+    def __init__(self, allowed: bool, remaining: int, retry_after: float = 0):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after
 
 
-async def custom_callback(request: Request, response: Response, pexpire: int):
+class Lease:
     """
-    default callback when too many requests
-    :param request:
-    :param pexpire: The remaining milliseconds
-    :param response:
-    :return:
+    tokens already counted in the shared window that this worker spends without
+    asking redis again until expires_at, or the time until which a denied identity
+    stays denied. index is the window the tokens were counted in, the unspent
+    ones are given back to it when the lease expires
     """
-    expire = round(pexpire / 1000)
 
-    raise HTTPException(
-        status.HTTP_429_TOO_MANY_REQUESTS,
-        f"Too Many Requests. Retry after {expire} seconds.",
-        headers={"Retry-After": str(expire)},
-    )
+    def __init__(self, tokens: int, remaining: int, index: int, expires_at: float, blocked_until: float = 0):
+        self.tokens = tokens
+        self.remaining = remaining
+        self.index = index
+        self.expires_at = expires_at
+        self.blocked_until = blocked_until
 
 
+class RateLimiter:
+    """
+    limit requests per identity over a sliding window shared by the workers.
 
-async def startup_redis():
-    redis_connection = await aioredis.from_url(
-        REDIS_URI, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(
-                redis=redis_connection,
-        identifier=service_name_identifier,
-        http_callback=custom_callback
-    )
-    yield
-    await FastAPILimiter.close()
+    the window lives in redis and is updated by one lua script (one round trip,
+    atomic). a worker takes a batch of tokens at a time and spends them from an
+    in-process lease for lease_seconds, so most requests are decided without
+    redis. the tokens left in an expired lease are given back with the next
+    batch, only the spent ones count. denials are remembered locally until the
+    window has room again.
 
+    without redis (tests, local runs) the window is kept in process and every
+    request takes exactly its cost, there is no batching. when redis
+    fails the requests are let through (fail open) and redis is not asked again
+    for RATE_LIMIT_REDIS_RETRY_SECONDS.
+    """
+
+    def __init__(
+        self,
+        namespace: str = "ratelimit",
+        batch: int = RATE_LIMIT_LOCAL_BATCH,
+        lease_seconds: float = RATE_LIMIT_LEASE_SECONDS,
+        local_maxsize: int = RATE_LIMIT_LOCAL_SIZE,
+    ):
+        self.namespace = namespace
+        self.batch = batch
+        self.lease_seconds = lease_seconds
+        # an expired lease is kept while its window counts, to give its tokens back
+        self.leases = TTLCache(maxsize=local_maxsize, ttl=lease_seconds)
+        self.windows = TTLCache(maxsize=local_maxsize, ttl=3600)
+        self.script = None
+        self.redis_retry_at = 0
+        self.errors = 0
+
+    def batch_size(self, limit: int, cost: int) -> int:
+        # small limits are leased in small batches, so the workers share them fairly
+        return max(cost, min(self.batch, limit // 20))
+
+    async def acquire(
+        self, key: str, limit: int, window_ms: int, now_ms: int, cost: int, requested: int,
+        refund_current: int = 0, refund_previous: int = 0,
+    ):
+        redis = get_redis()
+        if redis is None:
+            counts = self.windows.get(key) or {}
+            result = sliding_window(counts, limit, window_ms, now_ms, cost, requested, refund_current, refund_previous)
+            self.windows.set(key, counts, ttl=window_ms / 1000 * 2)
+            return result
+        if time.monotonic() < self.redis_retry_at:
+            return None
+        index, elapsed = divmod(now_ms, window_ms)
+        # the hash tag keeps both windows of a key on the same cluster slot
+        keys = [f"{self.namespace}:{{{key}}}:{index}", f"{self.namespace}:{{{key}}}:{index - 1}"]
+        if self.script is None:
+            self.script = redis.register_script(SLIDING_WINDOW_LUA)
+        try:
+            granted, remaining, retry_ms = await self.script(
+                keys=keys, args=[limit, window_ms, elapsed, cost, requested, refund_current, refund_previous])
+        except RedisError:
+            self.errors += 1
+            self.redis_retry_at = time.monotonic() + RATE_LIMIT_REDIS_RETRY_SECONDS
+            return None
+        return int(granted), int(remaining), int(retry_ms)
+
+    async def hit(self, key: str, limit: int, window_seconds: int, cost: int = 1) -> RateLimitDecision:
+        now = time.monotonic()
+        window_ms = window_seconds * 1000
+        now_ms = int(time.time() * 1000)
+        index = now_ms // window_ms
+        lease = self.leases.get(key)
+        left, refund_current, refund_previous = 0, 0, 0
+        if lease is not None:
+            if lease.blocked_until > now:
+                return RateLimitDecision(False, 0, lease.blocked_until - now)
+            if lease.expires_at > now and lease.tokens >= cost:
+                lease.tokens -= cost
+                return RateLimitDecision(True, lease.remaining + lease.tokens)
+            # the tokens are taken before awaiting redis, so the concurrent hits
+            # of the key neither spend nor give them back twice
+            taken, lease.tokens = lease.tokens, 0
+            if lease.expires_at > now:
+                left = taken
+            elif lease.index == index:
+                refund_current = taken
+            elif lease.index == index - 1:
+                refund_previous = taken
+        requested = cost - left
+        if get_redis() is not None:
+            requested = max(requested, self.batch_size(limit, cost))
+        result = await self.acquire(key, limit, window_ms, now_ms, cost - left, requested, refund_current, refund_previous)
+        # the lease of the key may have been replaced or topped up meanwhile
+        current = self.leases.get(key)
+        if result is None:
+            # fail open, the tokens taken go back to the lease
+            if current is not None:
+                current.tokens += left + refund_current + refund_previous
+            return RateLimitDecision(True, limit)
+        granted, remaining, retry_ms = result
+        # kept while the window it was counted in still weighs
+        ttl = window_seconds * 2
+        if not granted:
+            retry_after = retry_ms / 1000
+            # the tokens left in a live lease stay in it, to be given back when it expires
+            if current is None:
+                current = Lease(0, remaining, index, now)
+            current.tokens += left
+            current.remaining, current.blocked_until = remaining, now + retry_after
+            self.leases.set(key, current, ttl=max(retry_after, ttl))
+            return RateLimitDecision(False, remaining, retry_after)
+        tokens = left + granted - cost
+        if current is not None and current.expires_at > now and current.blocked_until <= now:
+            # merged with the batch of a concurrent hit instead of replacing it
+            current.tokens += tokens
+            current.remaining = min(current.remaining, remaining)
+            current.index, current.expires_at = index, now + self.lease_seconds
+            lease = current
+        else:
+            lease = Lease(tokens, remaining, index, now + self.lease_seconds)
+        self.leases.set(key, lease, ttl=ttl)
+        return RateLimitDecision(True, lease.remaining + lease.tokens)
 
+    def give_back(self, key: str, cost: int = 1):
+        """
+        returns the cost of an allowed hit to the lease of key, e.g. when another
+        limit denied the request. it is spent by the next hit or given back to the
+        window when the lease expires
+        """
+        lease = self.leases.get(key)
+        if lease is not None:
+            lease.tokens += cost
 
-def get_rate_limiter():
-    with RateLimiter(times=REQUEST_RATE_LIMIT_MINUTE, seconds=60) as rl:
-        yield rl
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if get_redis() is not None else "local",
+            "errors": self.errors,
+            "leases": len(self.leases),
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+async def client_identity(request: Request) -> str:
+    """
+    the user of a valid bearer token, otherwise the client ip. the token is only
+    decoded (cached), the user is looked up later by the route. behind a proxy
+    the client ip is the X-Forwarded-For address, see FORWARDED_ALLOW_IPS
+    """
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() == "bearer" and token:
+        try:
+            username = (await decode_access_token(token)).get("sub")
+        except InvalidTokenError:
+            username = None
+        if username:
+            return f"user:{username}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class RouteLimit:
+    def __init__(self, cost: int = 1, per_minute: int | None = None):
+        self.cost = cost
+        self.per_minute = per_minute
+
+
+DEFAULT_ROUTE_LIMIT = RouteLimit()
+
+
+def rate_limit(cost: int = 1, per_minute: int | None = None):
+    """
+    declares what a route costs against the per identity budget of
+    REQUEST_RATE_LIMIT_MINUTE (1 by default) and an optional quota of its own
+    (requests per minute per identity), read by get_rate_limiter:
+
+        @tasks_routers.get("/statistics")
+        @rate_limit(cost=10, per_minute=RATE_LIMIT_EXPENSIVE_MINUTE)
+        async def get_statistics(...):
+    """
+    def decorator(endpoint):
+        endpoint.rate_limit = RouteLimit(cost, per_minute)
+        return endpoint
+    return decorator
+
+
+def too_many_requests(decision: RateLimitDecision, limit: int) -> HTTPException:
+    expire = math.ceil(decision.retry_after)
+    return HTTPException(
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        f"Too Many Requests. Retry after {expire} seconds.",
+        headers={
+            "Retry-After": str(expire),
+            RATE_LIMIT_LIMIT_HEADER: str(limit),
+            RATE_LIMIT_REMAINING_HEADER: "0",
+        },
+    )
+
+
+async def get_rate_limiter(request: Request, response: Response) -> RateLimitDecision:
+    """
+    router dependency, charges the route declared with rate_limit. the headers
+    report the quota that runs out first, in requests of this route, from the
+    local lease (no extra redis call)
+    """
+    route_limit = getattr(request.scope.get("endpoint"), "rate_limit", DEFAULT_ROUTE_LIMIT)
+    identity = await client_identity(request)
+    decision, limit, route_key = None, None, None
+    if route_limit.per_minute:
+        # a request denied by one quota spends neither: the route quota goes first
+        # and is given back when the budget denies the request
+        route = request.scope.get("route")
+        route_key = f"{identity}:{getattr(route, 'name', request.url.path)}"
+        limit = route_limit.per_minute
+        decision = await rate_limiter.hit(route_key, limit, 60)
+        if not decision.allowed:
+            raise too_many_requests(decision, limit)
+    budget = await rate_limiter.hit(identity, REQUEST_RATE_LIMIT_MINUTE, 60, cost=route_limit.cost)
+    if not budget.allowed:
+        if route_key is not None:
+            rate_limiter.give_back(route_key)
+        raise too_many_requests(budget, REQUEST_RATE_LIMIT_MINUTE)
+    remaining = budget.remaining // route_limit.cost
+    if decision is None or remaining < decision.remaining:
+        decision, limit = RateLimitDecision(True, remaining), REQUEST_RATE_LIMIT_MINUTE
+    response.headers[RATE_LIMIT_LIMIT_HEADER] = str(limit)
+    response.headers[RATE_LIMIT_REMAINING_HEADER] = str(decision.remaining)
+    return decision
 
 
-TMRateLimiter = Annotated[RateLimiter, Depends(get_rate_limiter)]
+TMRateLimiter = Annotated[RateLimitDecision, Depends(get_rate_limiter)]
@@ -0,0 +1,51 @@
+from redis.asyncio import Redis
+
+from app.core.config import REDIS_HOST, REDIS_SOCKET_TIMEOUT_SECONDS, REDIS_URI
+
+
+redis_client: Redis | None = None
+pubsub_client: Redis | None = None
+
+# seconds between pings of an idle pubsub connection, a dead one is noticed then
+PUBSUB_HEALTH_CHECK_SECONDS = 30
+
+
+def get_redis() -> Redis | None:
+    """
+    shared redis client, None when redis is not configured (e.g. tests)
+    """
+    global redis_client
+    if not REDIS_HOST:
+        return None
+    if redis_client is None:
+        redis_client = Redis.from_url(
+            REDIS_URI, encoding="utf-8", decode_responses=True,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS, socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS)
+    return redis_client
+
+
+def get_pubsub_redis() -> Redis | None:
+    """
+    client of the long lived subscriptions. a subscriber waits for messages as
+    long as there are none, so its reads have no socket timeout (the one of
+    get_redis would drop an idle subscription every REDIS_SOCKET_TIMEOUT_SECONDS)
+    """
+    global pubsub_client
+    if not REDIS_HOST:
+        return None
+    if pubsub_client is None:
+        pubsub_client = Redis.from_url(
+            REDIS_URI, encoding="utf-8", decode_responses=True,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS, socket_keepalive=True,
+            health_check_interval=PUBSUB_HEALTH_CHECK_SECONDS)
+    return pubsub_client
+
+
+async def close_redis():
+    global redis_client, pubsub_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+    if pubsub_client is not None:
+        await pubsub_client.aclose()
+        pubsub_client = None
@@ -0,0 +1,32 @@
+import orjson
+
+from fastapi import Response
+
+
+JSON_MEDIA_TYPE = "application/json"
+
+# datetimes as pydantic writes them (naive iso, utc as "Z"), so both paths send the same json
+JSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+def json_bytes(content) -> bytes:
+    return orjson.dumps(content, option=JSON_OPTIONS)
+
+
+def response_headers(response: Response | None) -> dict[str, str]:
+    """
+    headers set on the injected response (X-Next-Cursor, ETag, rate limit), lost
+    when the route returns a Response of its own unless copied
+    """
+    if response is None:
+        return {}
+    return { key: value for key, value in response.headers.items() if key != "content-length" }
+
+
+def json_response(content, response: Response | None = None) -> Response:
+    """
+    content serialized once with orjson and sent as is, the response_model of the
+    route is not applied: only for documents built by the application (trusted).
+    keeps the headers already set on response (X-Next-Cursor, ETag, rate limit)
+    """
+    return Response(json_bytes(content), media_type=JSON_MEDIA_TYPE, headers=response_headers(response))
@@ -1,26 +1,56 @@
+import asyncio
+import hashlib
+import heapq
+import math
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from typing import Annotated
 
 import jwt
 
+from jwt.exceptions import InvalidTokenError
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
+from redis.exceptions import RedisError
 
-from app.core.config import HASH_ALGORITHM, SECRET_KEY, TOKEN_EXPIRED_TIME_MINUTES
+from app.core.cache import cache_invalidator, TTLCache
+from app.core.config import HASH_ALGORITHM, PASSWORD_HASH_WORKERS, SECRET_KEY, TOKEN_CACHE_SIZE
+from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES, TOKEN_EXPIRED_TIME_MINUTES
+from app.core.redis import get_redis
 from app.models.token import TokenData
 from app.models.user import UserPublic
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# new hashes use argon2, bcrypt hashes are still accepted and upgraded on login
+pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+
+# hashing is cpu bound and takes tens of milliseconds, it never runs on the event loop.
+# both argon2 and bcrypt release the GIL so a small thread pool is enough.
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+async def run_in_hash_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, func, *args)
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await run_in_hash_executor(pwd_context.verify, plain_password, hashed_password)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def verify_and_update_password(plain_password, hashed_password):
+    """
+    returns (verified, new_hash), new_hash is not None when the stored hash
+    uses a deprecated scheme and must be replaced
+    """
+    return await run_in_hash_executor(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def get_password_hash(password):
+    return await run_in_hash_executor(pwd_context.hash, password)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -33,3 +63,109 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=HASH_ALGORITHM)
     return encoded_jwt
+
+
+# sha256(token) -> payload of a token whose signature was already verified
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=60)
+cache_invalidator.register("token", token_cache)
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RevokedTokens:
+    """
+    sha256(token) of the tokens revoked by this worker until they expire. unlike
+    a TTLCache nothing is evicted before its expiry, a revoked token would be
+    accepted again: the size is bounded by the tokens revoked within one token
+    lifetime
+    """
+
+    def __init__(self):
+        self.expires_at: dict[str, float] = {}
+        self.expiry_heap: list[tuple[float, str]] = []
+
+    def purge(self):
+        now = time.monotonic()
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self.expiry_heap)
+            if self.expires_at.get(key) == expires_at:
+                del self.expires_at[key]
+
+    def add(self, key: str, ttl: float):
+        self.purge()
+        expires_at = time.monotonic() + ttl
+        if expires_at > self.expires_at.get(key, 0):
+            self.expires_at[key] = expires_at
+            heapq.heappush(self.expiry_heap, (expires_at, key))
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self.expires_at.get(key)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def __len__(self):
+        self.purge()
+        return len(self.expires_at)
+
+
+# the other workers find the revocations in redis
+revoked_tokens = RevokedTokens()
+REVOKED_TOKEN_PREFIX = "revoked-token:"
+
+
+async def is_token_revoked(key: str) -> bool:
+    if key in revoked_tokens:
+        return True
+    redis = get_redis()
+    if redis is None:
+        return False
+    try:
+        return bool(await redis.exists(REVOKED_TOKEN_PREFIX + key))
+    except RedisError:
+        # same as the other redis reads: the request goes on without it
+        return False
+
+
+async def decode_access_token(token: str) -> dict:
+    """
+    jwt.decode with a cache of verified tokens, clients send the same token
+    on every request until it expires. the revocation list is only read when
+    a token is verified (revoking evicts it from every cache).
+    raises jwt InvalidTokenError
+    """
+    key = token_digest(token)
+    payload = token_cache.get(key)
+    if payload is None:
+        generation = token_cache.generation
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[HASH_ALGORITHM])
+        if await is_token_revoked(key):
+            raise InvalidTokenError("Token revoked")
+        exp = payload.get("exp")
+        ttl = exp - time.time() if exp is not None else None
+        token_cache.set(key, payload, ttl=ttl, generation=generation)
+    return payload
+
+
+async def revoke_access_token(token: str):
+    """
+    rejects the token until it expires: its digest is kept in redis (shared by
+    the workers) for the rest of its lifetime and it is evicted from the cache
+    of every worker
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[HASH_ALGORITHM])
+    except InvalidTokenError:
+        # expired or invalid, already rejected
+        return
+    key = token_digest(token)
+    exp = payload.get("exp")
+    ttl = exp - time.time() if exp is not None else ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    revoked_tokens.add(key, ttl)
+    redis = get_redis()
+    if redis is not None:
+        try:
+            await redis.set(REVOKED_TOKEN_PREFIX + key, 1, ex=max(1, math.ceil(ttl)))
+        except RedisError:
+            pass
+    await cache_invalidator.invalidate("token", key)
@@ -0,0 +1,40 @@
+import time
+
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """
+    duration of the startup steps of the worker, reported by /root/stats so a
+    slower boot shows up
+    """
+
+    def __init__(self):
+        self.steps: dict[str, float] = {}
+        self.total: float | None = None
+        self.started_at: float | None = None
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = time.perf_counter() - start
+
+    def start(self):
+        self.steps.clear()
+        self.total = None
+        self.started_at = time.perf_counter()
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started_at
+
+    def stats(self) -> dict:
+        return {
+            "total_ms": None if self.total is None else round(self.total * 1000, 2),
+            "steps_ms": { name: round(seconds * 1000, 2) for name, seconds in self.steps.items() },
+        }
+
+
+startup_timer = StartupTimer()
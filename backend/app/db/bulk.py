@@ -0,0 +1,178 @@
+from datetime import datetime, timezone
+
+from pydantic import ValidationError
+from sqlmodel import delete, insert, select, update
+
+from app.db.stats import bump_task_counters, counter_deltas, TASK_COUNTER_COLUMNS
+from app.db.tasks import invalid_task_fields, resolve_priorities, TASK_PUBLIC_COLUMNS, to_task_public
+from app.models.task import TaskBulkItemResult, TaskCommentDB, TaskCreate, TaskDB, TaskUpdate
+from app.models.user import UserDB
+
+
+def item_error(index: int, status: int, detail, id: int | None = None) -> TaskBulkItemResult:
+    return TaskBulkItemResult(index=index, id=id, status=status, detail=detail)
+
+
+def validation_detail(error: ValidationError) -> list:
+    return error.errors(include_url=False, include_context=False, include_input=False)
+
+
+async def existing_user_ids(session, user_ids) -> set:
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return set()
+    return set((await session.exec(select(UserDB.id).where(UserDB.id.in_(user_ids)))).all())
+
+
+async def bulk_create_tasks(session, items: list, created_by: int) -> list[TaskBulkItemResult]:
+    """
+    validates the items and inserts the valid ones with one multi-row insert ... returning.
+    results are in the order of the items, the caller commits.
+    """
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, TaskCreate.model_validate(item)))
+        except ValidationError as e:
+            results[index] = item_error(index, 422, validation_detail(e))
+
+    priorities = await resolve_priorities({task.priority for _, task in parsed}, session)
+    users = await existing_user_ids(session, {task.assigned_to for _, task in parsed})
+    current_time = datetime.now(timezone.utc)
+    indexes, values = [], []
+    for index, task in parsed:
+        priority_id = priorities.id(task.priority)
+        if task.priority is not None and priority_id is None:
+            results[index] = item_error(index, 404, "Priority not found")
+            continue
+        if invalid_task_fields(task):
+            results[index] = item_error(index, 422, invalid_task_fields(task))
+            continue
+        if task.assigned_to is not None and task.assigned_to not in users:
+            results[index] = item_error(index, 404, "User not found")
+            continue
+        indexes.append(index)
+        values.append({
+            "title": task.title,
+            "description": task.description,
+            "assigned_to": task.assigned_to,
+            "created_at": current_time,
+            "due_date": task.due_date,
+            "completed": task.completed,
+            "created_by": created_by,
+            "updated_at": current_time,
+            "priority_id": priority_id,
+        })
+
+    if values:
+        rows = (await session.exec(
+            insert(TaskDB).returning(*TASK_PUBLIC_COLUMNS, sort_by_parameter_order=True),
+            params=values)).all()
+        for index, row in zip(indexes, rows):
+            results[index] = TaskBulkItemResult(index=index, id=row.id, status=200, task=to_task_public(row, priorities))
+        await bump_task_counters(session, counter_deltas(added=rows))
+    return results
+
+
+async def bulk_update_tasks(session, items: list) -> list[TaskBulkItemResult]:
+    """
+    partial updates by id: one select of the current rows (locked), one batched
+    update by primary key and one select of the updated rows. the caller commits.
+    """
+    results = [None] * len(items)
+    parsed = []
+    seen = set()
+    for index, item in enumerate(items):
+        try:
+            task = TaskUpdate.model_validate(item)
+        except ValidationError as e:
+            results[index] = item_error(index, 422, validation_detail(e))
+            continue
+        if task.id is None:
+            results[index] = item_error(index, 422, "Task id is required")
+        elif invalid_task_fields(task):
+            results[index] = item_error(index, 422, invalid_task_fields(task), id=task.id)
+        elif task.id in seen:
+            results[index] = item_error(index, 422, "Duplicated task id", id=task.id)
+        else:
+            seen.add(task.id)
+            parsed.append((index, task))
+
+    priorities = await resolve_priorities(
+        {task.priority for _, task in parsed if "priority" in task.model_fields_set}, session)
+    users = await existing_user_ids(session, {task.assigned_to for _, task in parsed} | {task.created_by for _, task in parsed})
+    old_rows = {}
+    if parsed:
+        old_rows = { row.id: row for row in (await session.exec(
+            select(TaskDB.id, *TASK_COUNTER_COLUMNS)
+                .where(TaskDB.id.in_([task.id for _, task in parsed]))
+                .with_for_update())).all() }
+
+    current_time = datetime.now(timezone.utc)
+    indexes, values = [], []
+    for index, task in parsed:
+        if task.id not in old_rows:
+            results[index] = item_error(index, 404, "Task not found", id=task.id)
+            continue
+        # the primary key is never updated
+        task_data = task.model_dump(exclude_unset=True, exclude={"id"})
+        task_data["updated_at"] = current_time
+        if "priority" in task_data:
+            desc = task_data.pop("priority")
+            task_data["priority_id"] = priorities.id(desc)
+            if desc is not None and task_data["priority_id"] is None:
+                results[index] = item_error(index, 404, "Priority not found", id=task.id)
+                continue
+        if any(task_data.get(key) is not None and task_data[key] not in users for key in ("assigned_to", "created_by")):
+            results[index] = item_error(index, 404, "User not found", id=task.id)
+            continue
+        indexes.append(index)
+        values.append({"id": task.id, **task_data})
+
+    if values:
+        # orm bulk update by primary key, executemany grouped by the set of updated columns
+        await session.exec(update(TaskDB), params=values)
+        rows = { row.id: row for row in (await session.exec(
+            select(*TASK_PUBLIC_COLUMNS)
+                .where(TaskDB.id.in_([value["id"] for value in values])))).all() }
+        for index, value in zip(indexes, values):
+            row = rows[value["id"]]
+            results[index] = TaskBulkItemResult(index=index, id=row.id, status=200, task=to_task_public(row, priorities))
+        await bump_task_counters(session, counter_deltas(
+            removed=[old_rows[value["id"]] for value in values],
+            added=list(rows.values())))
+    return results
+
+
+async def bulk_delete_tasks(session, ids: list[int]) -> list[TaskBulkItemResult]:
+    """
+    deletes the tasks and their comments with one statement each, the caller commits
+    """
+    results = [None] * len(ids)
+    unique_ids = []
+    seen = set()
+    for index, task_id in enumerate(ids):
+        if task_id in seen:
+            results[index] = item_error(index, 422, "Duplicated task id", id=task_id)
+        else:
+            seen.add(task_id)
+            unique_ids.append(task_id)
+
+    rows = {}
+    if unique_ids:
+        await session.exec(delete(TaskCommentDB).where(TaskCommentDB.task_id.in_(unique_ids)))
+        rows = { row.id: row for row in (await session.exec(
+            delete(TaskDB)
+                .where(TaskDB.id.in_(unique_ids))
+                .returning(*TASK_PUBLIC_COLUMNS))).all() }
+    priorities = await resolve_priorities((), session)
+    for index, task_id in enumerate(ids):
+        if results[index] is not None:
+            continue
+        if task_id in rows:
+            results[index] = TaskBulkItemResult(index=index, id=task_id, status=200, task=to_task_public(rows[task_id], priorities))
+        else:
+            results[index] = item_error(index, 404, "Task not found", id=task_id)
+    await bump_task_counters(session, counter_deltas(removed=list(rows.values())))
+    return results
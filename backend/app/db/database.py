@@ -1,64 +1,107 @@
-from uuid import UUID
 from typing import Annotated
 
 from fastapi import Depends
-from sqlmodel import create_engine, Field, select, Session, SQLModel
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.config import DATABASE_URL, SUPERUSER_PASSWORD, SUPERUSER_USERNAME
+from app.core.config import ASYNC_DATABASE_URL, DB_MIGRATE_ON_STARTUP, SUPERUSER_PASSWORD, SUPERUSER_USERNAME
+from app.core.config import DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT
 from app.core.security import get_password_hash
-from app.models.task import TaskDB, TaskPriority
+from app.db.pool import engine_pool_options
+from app.db.migrations import migrate, pending_migrations
+from app.models.task import TaskPriority
 from app.models.user import UserDB
 
-# engine = create_engine(DATABASE_URL)
-# SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-# Base = declarative_base()
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(DATABASE_URL)
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **engine_pool_options(
+        ASYNC_DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    ),
+)
 
-db_config = { "autocommit": False, "autoflush": False}
+# expire_on_commit is disabled because attributes can not be lazy loaded
+# once the session is committed (there is no implicit io in async mode)
+db_config = { "autoflush": False, "expire_on_commit": False }
 
 
-def get_session():
-    with Session(engine, **db_config) as session:
+async def get_session():
+    async with AsyncSession(engine, **db_config) as session:
         yield session
 
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-
-
-def fill_task_priority_table():
-    TASK_PRIORITIES = [
-        TaskPriority(id=0, desc="Low"),
-        TaskPriority(id=1, desc="Medium"),
-        TaskPriority(id=2, desc="High"),
-    ]
-    s = next(get_session())
-    for priority in TASK_PRIORITIES:
-        exists = s.exec(select(TaskPriority).where(TaskPriority.id == priority.id)).first()
-        if not exists:
-            s.add(priority)
-    s.commit()
-
-
-def create_super_user():
-    hashed_password = get_password_hash(SUPERUSER_PASSWORD)
-    super_user = UserDB()
-    super_user.username = SUPERUSER_USERNAME
-    super_user.hashed_password = hashed_password
-    super_user.isadmin=True
-    s = next(get_session())
-    exists = s.exec(
-        select(UserDB)
-        .where(UserDB.username == super_user.username)
-    ).first()
-    if not exists:
-        s.add(super_user)
-    s.commit()
-
-
-
-
-SessionDep = Annotated[Session, Depends(get_session)]
-
+def insert_ignore(model):
+    """
+    INSERT ... ON CONFLICT DO NOTHING (postgresql and sqlite)
+    """
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model).on_conflict_do_nothing()
+
+
+async def create_db_and_tables():
+    """
+    applies the pending schema migrations (python -m app.manage migrate)
+    """
+    await migrate(engine)
+
+
+async def check_migrations():
+    """
+    startup check: the schema is migrated by a separate command, the workers only
+    verify it (one query) unless DB_MIGRATE_ON_STARTUP is set
+    """
+    if DB_MIGRATE_ON_STARTUP:
+        await migrate(engine)
+        return
+    async with engine.connect() as conn:
+        pending = await pending_migrations(conn)
+    if pending:
+        raise RuntimeError(
+            f"{len(pending)} pending schema migrations ({pending[0].version}: {pending[0].name}...), "
+            "run python -m app.manage migrate")
+
+
+TASK_PRIORITIES = [
+    {"id": 0, "desc": "Low"},
+    {"id": 1, "desc": "Medium"},
+    {"id": 2, "desc": "High"},
+]
+
+
+async def fill_task_priority_table():
+    async with AsyncSession(engine, **db_config) as s:
+        await s.exec(insert_ignore(TaskPriority).values(TASK_PRIORITIES))
+        await s.commit()
+
+
+async def create_super_user():
+    """
+    the password is only hashed when the superuser does not exist yet
+    """
+    async with AsyncSession(engine, **db_config) as s:
+        exists = (await s.exec(select(UserDB.id).where(UserDB.username == SUPERUSER_USERNAME))).first()
+        if exists is not None:
+            return
+        hashed_password = await get_password_hash(SUPERUSER_PASSWORD)
+        # another worker may have created it meanwhile
+        await s.exec(insert_ignore(UserDB).values(
+            username=SUPERUSER_USERNAME, hashed_password=hashed_password, enabled=True, isadmin=True))
+        await s.commit()
+
+
+async def bootstrap():
+    """
+    seed rows every worker makes sure of on startup, cheap when they exist
+    """
+    await fill_task_priority_table()
+    await create_super_user()
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
@@ -0,0 +1,101 @@
+import time
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import cache_invalidator
+from app.core.config import DIMENSION_RELOAD_SECONDS
+from app.db.database import db_config, engine
+from app.models.task import TaskPriority, TaskStatus
+
+
+class DimensionTable:
+    """
+    id <-> desc maps of a small static table (task_priority, task_status),
+    loaded once per process instead of being queried on every request
+    """
+
+    def __init__(self, model, reload_seconds: float = DIMENSION_RELOAD_SECONDS):
+        self.model = model
+        self.reload_seconds = reload_seconds
+        self.by_id: dict[int, str] = {}
+        self.by_desc: dict[str, int] = {}
+        self.loaded = False
+        self.loaded_at = float("-inf")
+
+    async def load(self, session):
+        rows = (await session.exec(select(self.model))).all()
+        self.by_id = {row.id: row.desc for row in rows}
+        self.by_desc = {row.desc: row.id for row in rows}
+        self.loaded = True
+        self.loaded_at = time.monotonic()
+
+    async def ensure_loaded(self, session):
+        if not self.loaded:
+            await self.load(session)
+
+    async def reload_missing(self, session) -> bool:
+        """
+        reload after an unknown id or desc, in case the row was added after the
+        load. at most once per reload_seconds: a client repeating a bad value
+        does not query the table on every request
+        """
+        if time.monotonic() - self.loaded_at < self.reload_seconds:
+            return False
+        await self.load(session)
+        return True
+
+    def desc(self, id: int | None) -> str | None:
+        if id is None:
+            return None
+        return self.by_id.get(id)
+
+    def id(self, desc: str | None) -> int | None:
+        if desc is None:
+            return None
+        return self.by_desc.get(desc)
+
+
+class DimensionRegistry:
+    """
+    dimension tables by table name. registered in the cache invalidator:
+    an invalidation marks the table as stale and it is reloaded on next use
+    """
+
+    def __init__(self, tables: dict[str, DimensionTable]):
+        self.tables = tables
+
+    def pop(self, name: str):
+        table = self.tables.get(name)
+        if table is not None:
+            table.loaded = False
+
+    def clear(self):
+        for table in self.tables.values():
+            table.loaded = False
+
+    async def load_all(self, session):
+        for table in self.tables.values():
+            await table.load(session)
+
+
+task_priorities = DimensionTable(TaskPriority)
+task_statuses = DimensionTable(TaskStatus)
+
+dimensions = DimensionRegistry({
+    TaskPriority.__tablename__: task_priorities,
+    TaskStatus.__tablename__: task_statuses,
+})
+cache_invalidator.register("dimensions", dimensions)
+
+
+async def load_dimensions():
+    async with AsyncSession(engine, **db_config) as session:
+        await dimensions.load_all(session)
+
+
+async def invalidate_dimension(table_name: str):
+    """
+    refresh hook, call it after changing the rows of a dimension table
+    """
+    await cache_invalidator.invalidate("dimensions", table_name)
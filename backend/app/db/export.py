@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+
+from typing import Literal
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import TASK_EXPORT_CHUNK_SIZE
+from app.db.database import db_config, engine
+from app.db.dimensions import DimensionTable
+from app.db.tasks import to_task_public
+from app.models.task import TaskCommentDB, TaskCommentPublic, TaskPublic
+
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CSV_FIELDS = list(TaskPublic.model_fields)
+
+
+async def comments_by_task(session, task_ids: list[int]) -> dict[int, list]:
+    comments = {task_id: [] for task_id in task_ids}
+    rows = await session.exec(
+        select(TaskCommentDB)
+            .where(TaskCommentDB.task_id.in_(task_ids))
+            .order_by(TaskCommentDB.task_id, TaskCommentDB.created_at))
+    for comment in rows:
+        comments[comment.task_id].append(TaskCommentPublic.model_validate(comment).model_dump(mode="json"))
+    return comments
+
+
+def csv_lines(rows: list[dict], header: list[str] | None = None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow([
+            json.dumps(value, separators=(",", ":")) if isinstance(value, list) else value
+            for value in row.values()
+        ])
+    return buffer.getvalue()
+
+
+async def export_tasks(query, format: ExportFormat, include_comments: bool, priorities: DimensionTable):
+    """
+    body of a streaming export: the rows of query are read with a server-side cursor,
+    TASK_EXPORT_CHUNK_SIZE at a time, and written as they come, so memory does not
+    grow with the result. the export opens its own session, the request session is
+    closed before the body is sent.
+    """
+    async with AsyncSession(engine, **db_config) as session:
+        result = await session.stream(query.execution_options(yield_per=TASK_EXPORT_CHUNK_SIZE))
+        if format == "csv":
+            header = CSV_FIELDS + (["comments"] if include_comments else [])
+            yield csv_lines([], header)
+        async for chunk in result.partitions():
+            tasks = [to_task_public(row, priorities).model_dump(mode="json") for row in chunk]
+            if include_comments:
+                # one query per chunk
+                comments = await comments_by_task(session, [task["id"] for task in tasks])
+                for task in tasks:
+                    task["comments"] = comments[task["id"]]
+            if format == "csv":
+                yield csv_lines(tasks)
+            else:
+                yield "".join(json.dumps(task, separators=(",", ":")) + "\n" for task in tasks)
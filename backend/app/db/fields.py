@@ -0,0 +1,73 @@
+from fastapi import HTTPException
+
+from app.db.dimensions import DimensionTable
+from app.models.task import TaskCommentDB, TaskDB
+
+
+# fields= names of the task documents and the column each one is read from
+TASK_FIELDS = {
+    "id": TaskDB.id,
+    "title": TaskDB.title,
+    "description": TaskDB.description,
+    "assigned_to": TaskDB.assigned_to,
+    "created_by": TaskDB.created_by,
+    "created_at": TaskDB.created_at,
+    "due_date": TaskDB.due_date,
+    "completed": TaskDB.completed,
+    "updated_at": TaskDB.updated_at,
+    "priority": TaskDB.priority_id,
+    "comment_count": TaskDB.comment_count,
+    "last_comment_at": TaskDB.last_comment_at,
+}
+
+COMMENT_FIELDS = {
+    "id": TaskCommentDB.id,
+    "task_id": TaskCommentDB.task_id,
+    "description": TaskCommentDB.description,
+    "created_by": TaskCommentDB.created_by,
+    "created_at": TaskCommentDB.created_at,
+    "updated_at": TaskCommentDB.updated_at,
+}
+
+
+def parse_fields(fields: str | None, allowed: dict) -> list[str] | None:
+    """
+    fields=id,title,completed in request order, None when not given (400 on an unknown name)
+    """
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid fields: {', '.join(unknown) or fields}")
+    return names
+
+
+def projection_columns(allowed: dict, names: list[str], extra: list = ()) -> list:
+    """
+    columns of names plus the extra columns needed by the query (ordering, cursor),
+    each one selected once
+    """
+    columns = {}
+    for column in [*(allowed[name] for name in names), *extra]:
+        columns.setdefault(column.key, column)
+    return list(columns.values())
+
+
+def task_document(row, names: list[str], priorities: DimensionTable) -> dict:
+    return {
+        name: priorities.desc(row.priority_id) if name == "priority" else getattr(row, name)
+        for name in names
+    }
+
+
+def comment_document(row, names: list[str]) -> dict:
+    return { name: getattr(row, name) for name in names }
+
+
+def project(documents: list[dict], names: list[str]) -> list[dict]:
+    """
+    keeps only names in documents (cached or built with more keys)
+    """
+    return [{ name: document[name] for name in names if name in document } for document in documents]
+
@@ -0,0 +1,85 @@
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func
+from sqlmodel import select
+
+from app.models.task import TaskCommentDB, TaskCommentPublic
+from app.models.user import UserDB, UserPublic
+
+
+TASK_INCLUDES = ("comments", "assignee", "creator")
+
+# field of the task document each include is resolved from
+INCLUDE_KEY_FIELDS = {
+    "comments": "id",
+    "assignee": "assigned_to",
+    "creator": "created_by",
+}
+
+# latest comments embedded per task, the full list is paginated on /tasks/{task_id}/comments/
+INCLUDE_COMMENTS_LIMIT = 10
+
+
+def parse_includes(include: str | None) -> set[str]:
+    """
+    include=comments,assignee,creator (400 on an unknown name)
+    """
+    if not include:
+        return set()
+    includes = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = includes.difference(TASK_INCLUDES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid include: {', '.join(sorted(unknown))}")
+    return includes
+
+
+async def latest_comments_by_task(session, task_ids: list[int]) -> dict[int, list]:
+    """
+    the INCLUDE_COMMENTS_LIMIT latest comments of every task (oldest first) in one query
+    """
+    C = TaskCommentDB
+    position = func.row_number().over(
+        partition_by=C.task_id, order_by=(C.created_at.desc(), C.id.desc())).label("position")
+    latest = select(C, position).where(C.task_id.in_(task_ids)).subquery()
+    rows = await session.exec(
+        select(*latest.c)
+            .where(latest.c.position <= INCLUDE_COMMENTS_LIMIT)
+            .order_by(latest.c.task_id, latest.c.created_at, latest.c.id))
+    comments = {task_id: [] for task_id in task_ids}
+    for row in rows:
+        comments[row.task_id].append(jsonable_encoder(TaskCommentPublic.model_validate(row._mapping)))
+    return comments
+
+
+async def users_by_id(session, user_ids: set[int]) -> dict[int, dict]:
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    users = await session.exec(select(UserDB).where(UserDB.id.in_(user_ids)))
+    return { user.id: jsonable_encoder(UserPublic.model_validate(user)) for user in users }
+
+
+async def add_task_includes(session, tasks: list[dict], includes: set[str]) -> list[dict]:
+    """
+    embeds the related rows in the task documents, one query per kind of
+    relation whatever the number of tasks
+    """
+    if not includes or not tasks:
+        return tasks
+    if "comments" in includes:
+        comments = await latest_comments_by_task(session, [task["id"] for task in tasks])
+        for task in tasks:
+            task["comments"] = comments[task["id"]]
+    if "assignee" in includes or "creator" in includes:
+        user_ids = set()
+        if "assignee" in includes:
+            user_ids.update(task["assigned_to"] for task in tasks)
+        if "creator" in includes:
+            user_ids.update(task["created_by"] for task in tasks)
+        users = await users_by_id(session, user_ids)
+        for task in tasks:
+            if "assignee" in includes:
+                task["assignee"] = users.get(task["assigned_to"])
+            if "creator" in includes:
+                task["creator"] = users.get(task["created_by"])
+    return tasks
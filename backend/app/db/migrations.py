@@ -0,0 +1,207 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Index, insert, inspect, Integer, MetaData
+from sqlalchemy import select, String, Table, text
+
+
+# versions applied to the database, one row per migration
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# serializes concurrent runners on postgresql (pg_advisory_xact_lock key)
+MIGRATIONS_LOCK_KEY = 7_315_002
+
+
+class Migration:
+    def __init__(self, version: int, name: str, apply):
+        self.version = version
+        self.name = name
+        self.apply = apply
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str):
+    """
+    registers an async function(conn) as a schema migration. versions only grow,
+    an applied migration is never changed: a schema change is a new migration
+    """
+    def decorator(apply):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, "migration versions must grow"
+        MIGRATIONS.append(Migration(version, name, apply))
+        return apply
+    return decorator
+
+
+# the tables of version 1, frozen: the models follow the latest schema, these
+# definitions never change (later changes are later migrations)
+initial_schema_metadata = MetaData()
+
+Table(
+    "task_priority", initial_schema_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("desc", String, nullable=False, unique=True),
+)
+
+Table(
+    "task_status", initial_schema_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("desc", String, nullable=False),
+)
+
+Table(
+    "users", initial_schema_metadata,
+    Column("username", String, nullable=False, unique=True, index=True),
+    Column("full_name", String),
+    Column("email", String, unique=True),
+    Column("phone", String, unique=True),
+    Column("enabled", Boolean, nullable=False),
+    Column("isadmin", Boolean, nullable=False),
+    Column("id", Integer, primary_key=True),
+    Column("hashed_password", String, nullable=False),
+)
+
+Table(
+    "tasks", initial_schema_metadata,
+    Column("title", String, nullable=False),
+    Column("description", String),
+    Column("created_at", DateTime, nullable=False, index=True),
+    Column("due_date", DateTime, nullable=False, index=True),
+    Column("id", Integer, primary_key=True),
+    Column("priority_id", Integer, ForeignKey("task_priority.id")),
+    Column("created_by", Integer, ForeignKey("users.id"), nullable=False),
+    Column("assigned_to", Integer, ForeignKey("users.id")),
+    Column("updated_at", DateTime, nullable=False),
+    Column("completed", Boolean, nullable=False),
+)
+
+Table(
+    "comments", initial_schema_metadata,
+    Column("task_id", Integer, ForeignKey("tasks.id"), nullable=False, index=True),
+    Column("description", String, nullable=False),
+    Column("created_by", Integer, ForeignKey("users.id"), nullable=False),
+    Column("id", Integer, primary_key=True),
+    Column("created_at", DateTime, nullable=False, index=True),
+    Column("updated_at", DateTime, nullable=False, index=True),
+)
+
+
+def table_columns(sync_conn, table_name: str) -> set[str]:
+    return {column["name"] for column in inspect(sync_conn).get_columns(table_name)}
+
+
+# every migration is idempotent: databases created by create_all before
+# migrations existed go through them without changes. their ddl is written
+# out here, they do not call code of other modules that may change later
+@migration(1, "initial schema")
+async def initial_schema(conn):
+    await conn.run_sync(initial_schema_metadata.create_all)
+
+
+@migration(2, "comment activity columns on tasks")
+async def comment_activity_columns(conn):
+    # backfilled once from the comments
+    columns = await conn.run_sync(table_columns, "tasks")
+    if "comment_count" not in columns:
+        await conn.execute(text("ALTER TABLE tasks ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0"))
+        await conn.execute(text(
+            "UPDATE tasks SET comment_count = "
+            "(SELECT count(*) FROM comments WHERE comments.task_id = tasks.id)"))
+    if "last_comment_at" not in columns:
+        await conn.execute(text("ALTER TABLE tasks ADD COLUMN last_comment_at TIMESTAMP"))
+        await conn.execute(text(
+            "UPDATE tasks SET last_comment_at = "
+            "(SELECT max(created_at) FROM comments WHERE comments.task_id = tasks.id)"))
+
+
+@migration(3, "comments (task_id, created_at, id) index")
+async def comment_indexes(conn):
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_comments_task_id_created_at ON comments (task_id, created_at, id)"))
+
+
+# postgresql only: the tsvector of a task is a generated column, so every write
+# keeps it up to date (title weighs more than description), and comments are
+# searched through an expression index. the 'simple' configuration is the
+# SEARCH_LANGUAGE of app.db.search
+@migration(4, "full text search indexes")
+async def search_indexes(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    await conn.execute(text("""
+        ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+            ) STORED
+    """))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_comments_search_vector ON comments USING GIN (to_tsvector('simple', description))"))
+
+
+task_stats_counters = Table(
+    "task_stats_counters", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("created_by", Integer, nullable=False, index=True),
+    Column("assigned_to", Integer, index=True),
+    Column("priority_id", Integer),
+    Column("completed", Boolean, nullable=False),
+    Column("day", Date, nullable=False, index=True),
+    Column("count", Integer, nullable=False),
+)
+
+# overdue counts of the statistics, on a copy of the columns it needs (not on
+# initial_tasks, whose create_all would build it in version 1)
+open_due_date_index = Index(
+    "ix_tasks_open_due_date",
+    Table("tasks", MetaData(), Column("due_date", DateTime), Column("completed", Boolean)).c.due_date,
+    postgresql_where=text("NOT completed"), sqlite_where=text("completed = 0"))
+
+
+@migration(5, "task statistics counters")
+async def task_statistics_counters(conn):
+    has_table = await conn.run_sync(lambda sync_conn: sync_conn.dialect.has_table(sync_conn, task_stats_counters.name))
+    if not has_table:
+        await conn.run_sync(task_stats_counters.create)
+        # counted once from the existing tasks, the task routes keep them up to date
+        await conn.execute(text(
+            "INSERT INTO task_stats_counters (created_by, assigned_to, priority_id, completed, day, count) "
+            "SELECT created_by, assigned_to, priority_id, completed, date(created_at), count(*) FROM tasks "
+            "GROUP BY created_by, assigned_to, priority_id, completed, date(created_at)"))
+    await conn.run_sync(open_due_date_index.create, checkfirst=True)
+
+
+async def applied_versions(conn) -> set[int]:
+    has_table = await conn.run_sync(lambda sync_conn: sync_conn.dialect.has_table(sync_conn, schema_migrations.name))
+    if not has_table:
+        return set()
+    return set((await conn.execute(select(schema_migrations.c.version))).scalars())
+
+
+async def pending_migrations(conn) -> list[Migration]:
+    applied = await applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+async def migrate(engine) -> list[Migration]:
+    """
+    applies the pending migrations in one transaction (all or nothing on
+    postgresql) and returns them, concurrent runners wait for each other
+    """
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+        await conn.run_sync(schema_migrations.create, checkfirst=True)
+        pending = await pending_migrations(conn)
+        for m in pending:
+            await m.apply(conn)
+            await conn.execute(insert(schema_migrations).values(
+                version=m.version, name=m.name, applied_at=datetime.now(timezone.utc).replace(tzinfo=None)))
+    return pending
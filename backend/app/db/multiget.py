@@ -0,0 +1,66 @@
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import select
+
+from app.core.cache import read_cache
+from app.core.config import MULTI_GET_MAX_IDS
+from app.db.dimensions import DimensionTable
+from app.db.tasks import select_task_public, task_cache_key, to_task_public
+from app.db.users import user_cache_key
+from app.models.task import TaskDB, TaskMultiGetResult
+from app.models.user import UserDB, UserMultiGetResult, UserPublic
+
+
+def parse_ids(ids: str) -> list[int]:
+    """
+    ids=1,2,3 of the GET multi-get routes (400 when invalid or too many)
+    """
+    try:
+        parsed = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+    check_ids(parsed)
+    return parsed
+
+
+def check_ids(ids: list[int]):
+    if not ids:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+    if len(ids) > MULTI_GET_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MULTI_GET_MAX_IDS} ids")
+
+
+async def read_through_many(ids: list[int], cache_key, load) -> tuple[list, list[int]]:
+    """
+    documents of ids in request order through the read cache: one cache round
+    trip, then one load (IN query) for the misses. returns (documents, missing ids)
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    cached = await read_cache.get_many([cache_key(id) for id in unique_ids])
+    documents = { id: document for id, document in zip(unique_ids, cached) if document is not None }
+    misses = [id for id in unique_ids if id not in documents]
+    if misses:
+        generations = await read_cache.generations([cache_key(id) for id in misses])
+        loaded = await load(misses)
+        await read_cache.set_many(
+            { cache_key(id): document for id, document in loaded.items() }, generations=generations)
+        documents.update(loaded)
+    return [documents.get(id) for id in ids], [id for id in unique_ids if id not in documents]
+
+
+async def get_tasks_by_ids(session, ids: list[int], priorities: DimensionTable) -> TaskMultiGetResult:
+    async def load(task_ids):
+        rows = await session.exec(select_task_public().where(TaskDB.id.in_(task_ids)))
+        return { row.id: jsonable_encoder(to_task_public(row, priorities)) for row in rows }
+
+    results, missing = await read_through_many(ids, task_cache_key, load)
+    return TaskMultiGetResult(results=results, missing=missing)
+
+
+async def get_users_by_ids(session, ids: list[int]) -> UserMultiGetResult:
+    async def load(user_ids):
+        users = await session.exec(select(UserDB).where(UserDB.id.in_(user_ids)))
+        return { user.id: jsonable_encoder(UserPublic.model_validate(user)) for user in users }
+
+    results, missing = await read_through_many(ids, user_cache_key, load)
+    return UserMultiGetResult(results=results, missing=missing)
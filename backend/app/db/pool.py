@@ -0,0 +1,116 @@
+import time
+import weakref
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolStats:
+    """
+    counters collected by InstrumentedQueuePool (process wide)
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.connects = 0
+        self.connect_time_total = 0.0
+        self.connect_time_max = 0.0
+
+    def record_checkout(self, wait_time: float):
+        self.checkouts += 1
+        self.wait_time_total += wait_time
+        if wait_time > self.wait_time_max:
+            self.wait_time_max = wait_time
+
+    def record_connect(self, connect_time: float):
+        self.connects += 1
+        self.connect_time_total += connect_time
+        if connect_time > self.connect_time_max:
+            self.connect_time_max = connect_time
+
+    def record_timeout(self, wait_time: float):
+        self.timeouts += 1
+        self.wait_time_total += wait_time
+        if wait_time > self.wait_time_max:
+            self.wait_time_max = wait_time
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that measures how long a request waits to get a
+    connection, so waiting on the pool can be told apart from waiting on postgres.
+    opening a new connection (overflow) is counted as connect time, not as wait
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # connect time of the records opened by _do_get, by record
+        self._connect_times = weakref.WeakKeyDictionary()
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        record = super()._create_connection()
+        connect_time = time.perf_counter() - start
+        self._connect_times[record] = connect_time
+        pool_stats.record_connect(connect_time)
+        return record
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_timeout(time.perf_counter() - start)
+            raise
+        connect_time = self._connect_times.pop(conn, 0.0)
+        pool_stats.record_checkout(time.perf_counter() - start - connect_time)
+        return conn
+
+
+def engine_pool_options(url: str, **pool_options) -> dict:
+    """
+    create_async_engine arguments of the pool: InstrumentedQueuePool and
+    pool_options where the dialect pools its connections (postgresql, sqlite
+    files), nothing for the others (e.g. in-memory sqlite keeps its StaticPool)
+    """
+    url = make_url(url)
+    if not issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        return {}
+    return { "poolclass": InstrumentedQueuePool, **pool_options }
+
+
+def get_pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = {
+        "pool_class": pool.__class__.__name__,
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "wait_time_total_ms": round(pool_stats.wait_time_total * 1000, 3),
+        "wait_time_avg_ms": round(
+            pool_stats.wait_time_total * 1000 / max(pool_stats.checkouts + pool_stats.timeouts, 1), 3),
+        "wait_time_max_ms": round(pool_stats.wait_time_max * 1000, 3),
+        "connects": pool_stats.connects,
+        "connect_time_avg_ms": round(pool_stats.connect_time_total * 1000 / max(pool_stats.connects, 1), 3),
+        "connect_time_max_ms": round(pool_stats.connect_time_max * 1000, 3),
+    }
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # overflow() is negative while the pool has not been filled
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    return stats
@@ -0,0 +1,50 @@
+from sqlalchemy import and_, case, exists, func, literal_column, or_
+
+from app.models.task import TaskCommentDB, TaskDB
+
+
+# text search configuration of the search_vector column and of the comments
+# index, built by migration 4. it is part of the schema: another language is a
+# new migration rebuilding both, and this constant changes with it
+SEARCH_LANGUAGE = "simple"
+
+# same expressions as the ddl, so the planner uses the indexes
+task_search_vector = literal_column("tasks.search_vector")
+comment_search_vector = func.to_tsvector(literal_column(f"'{SEARCH_LANGUAGE}'"), TaskCommentDB.description)
+
+
+def like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_condition_and_rank(q: str, dialect_name: str, include_comments: bool):
+    """
+    where clause matching q and the rank of each match (higher first).
+    postgresql uses the tsvector (websearch syntax), other databases a LIKE per
+    word: every word must appear, words found in the title rank higher.
+    """
+    if dialect_name == "postgresql":
+        query = func.websearch_to_tsquery(literal_column(f"'{SEARCH_LANGUAGE}'"), q)
+        condition = task_search_vector.op("@@")(query)
+        if include_comments:
+            condition = or_(condition, exists().where(
+                TaskCommentDB.task_id == TaskDB.id,
+                comment_search_vector.op("@@")(query)))
+        # tasks matched only by a comment rank 0
+        return condition, func.ts_rank_cd(task_search_vector, query)
+
+    conditions = []
+    rank = literal_column("0.0")
+    for term in q.split():
+        pattern = like_pattern(term)
+        in_task = or_(
+            TaskDB.title.ilike(pattern, escape="\\"),
+            TaskDB.description.ilike(pattern, escape="\\"))
+        if include_comments:
+            in_task = or_(in_task, exists().where(
+                TaskCommentDB.task_id == TaskDB.id,
+                TaskCommentDB.description.ilike(pattern, escape="\\")))
+        conditions.append(in_task)
+        rank = rank + case((TaskDB.title.ilike(pattern, escape="\\"), 1.0), else_=0.0)
+    return and_(*conditions), rank
@@ -0,0 +1,307 @@
+from collections import Counter
+from datetime import date, datetime, time, timezone
+from typing import Literal
+
+from sqlalchemy import and_, func, literal_column, text
+from sqlmodel import delete, insert, select, update
+
+from app.db.dimensions import DimensionTable
+from app.models.task import TaskDB, TaskStatsCounterDB
+
+
+StatsGroupBy = Literal["priority", "assigned_to", "created_by", "day", "week"]
+
+
+def task_stats_columns(now: datetime) -> list:
+    """
+    counts computed by the database: total, completed and overdue
+    (not completed with due_date before now)
+    """
+    return [
+        func.count().label("total"),
+        func.count().filter(TaskDB.completed == True).label("completed"),
+        func.count().filter(and_(TaskDB.completed == False, TaskDB.due_date < now)).label("overdue"),
+    ]
+
+
+def group_by_expression(group_by: StatsGroupBy, dialect_name: str):
+    if group_by == "priority":
+        return TaskDB.priority_id
+    if group_by == "assigned_to":
+        return TaskDB.assigned_to
+    if group_by == "created_by":
+        return TaskDB.created_by
+    if dialect_name == "postgresql":
+        # rendered inline: a bound parameter in both SELECT and GROUP BY makes
+        # two distinct parameters and postgres rejects the grouping
+        return func.date_trunc(literal_column(f"'{group_by}'"), TaskDB.created_at)
+    # sqlite (tests): weeks start on monday like date_trunc
+    if group_by == "week":
+        return func.date(TaskDB.created_at, "-6 days", "weekday 1")
+    return func.date(TaskDB.created_at)
+
+
+def group_key(value, group_by: StatsGroupBy, priorities: DimensionTable):
+    if group_by == "priority":
+        return priorities.desc(value)
+    if group_by in ("day", "week") and isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def stats_detail(total: int, completed: int, overdue: int) -> dict:
+    return {
+        "completed": completed,
+        "no_completed": total - completed,
+        "total": total,
+        "overdue": overdue,
+    }
+
+
+async def compute_task_stats(session, filters: list, group_by: StatsGroupBy | None, priorities: DimensionTable) -> dict:
+    """
+    task statistics in a single aggregate query, with an optional breakdown
+    """
+    now = datetime.now(timezone.utc)
+    if group_by is None:
+        query = select(*task_stats_columns(now)).select_from(TaskDB).where(*filters)
+        row = (await session.exec(query)).one()
+        return { "detail": stats_detail(row.total, row.completed, row.overdue) }
+
+    key = group_by_expression(group_by, session.bind.dialect.name).label("key")
+    query = (
+        select(key, *task_stats_columns(now))
+            .select_from(TaskDB)
+            .where(*filters)
+            .group_by(key)
+            .order_by(key))
+    rows = (await session.exec(query)).all()
+    groups = [
+        { "key": group_key(row.key, group_by, priorities), **stats_detail(row.total, row.completed, row.overdue) }
+        for row in rows
+    ]
+    return {
+        "detail": stats_detail(
+            sum(row.total for row in rows),
+            sum(row.completed for row in rows),
+            sum(row.overdue for row in rows)),
+        "group_by": group_by,
+        "groups": groups,
+    }
+
+
+# -------------------------------------------------------------------------------------------------
+# counters (task_stats_counters)
+# -------------------------------------------------------------------------------------------------
+
+# columns of a task that make its counter key, select/return them to maintain the counters
+TASK_COUNTER_COLUMNS = (
+    TaskDB.created_by,
+    TaskDB.assigned_to,
+    TaskDB.priority_id,
+    TaskDB.completed,
+    TaskDB.created_at,
+)
+TASK_COUNTER_FIELDS = { column.key for column in TASK_COUNTER_COLUMNS }
+
+# group_by answered from the counters and the counter column of each
+COUNTER_GROUP_COLUMNS = {
+    "priority": TaskStatsCounterDB.priority_id,
+    "assigned_to": TaskStatsCounterDB.assigned_to,
+    "created_by": TaskStatsCounterDB.created_by,
+    "day": TaskStatsCounterDB.day,
+}
+
+
+def as_date(value) -> date:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def counter_key(task) -> tuple:
+    """
+    counter key of a task row (or object) holding TASK_COUNTER_COLUMNS
+    """
+    return (task.created_by, task.assigned_to, task.priority_id, bool(task.completed), as_date(task.created_at))
+
+
+def counter_deltas(removed: list = (), added: list = ()) -> Counter:
+    deltas = Counter()
+    for task in removed:
+        deltas[counter_key(task)] -= 1
+    for task in added:
+        deltas[counter_key(task)] += 1
+    return deltas
+
+
+async def bump_task_counters(session, deltas: Counter):
+    """
+    applies the deltas in the current transaction (the caller commits)
+    """
+    C = TaskStatsCounterDB
+    for key, delta in deltas.items():
+        if delta == 0:
+            continue
+        created_by, assigned_to, priority_id, completed, day = key
+        same_key = select(C.id).where(
+            C.created_by == created_by,
+            C.assigned_to.is_not_distinct_from(assigned_to),
+            C.priority_id.is_not_distinct_from(priority_id),
+            C.completed == completed,
+            C.day == day,
+        ).limit(1).scalar_subquery()
+        result = await session.exec(update(C).where(C.id == same_key).values(count=C.count + delta))
+        if result.rowcount == 0:
+            await session.exec(insert(C).values(
+                created_by=created_by,
+                assigned_to=assigned_to,
+                priority_id=priority_id,
+                completed=completed,
+                day=day,
+                count=delta,
+            ))
+
+
+def is_day_boundary(value: datetime) -> bool:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.time() == time(0)
+
+
+def counter_filters(
+    created_by: int | None,
+    assigned_to: int | None,
+    completed: bool | None,
+    created_at_start: datetime | None,
+    created_at_end: datetime | None,
+    due_date_at_start: datetime | None,
+    due_date_at_end: datetime | None,
+    group_by: StatsGroupBy | None,
+) -> list | None:
+    """
+    where clauses on the counters for these statistics filters,
+    None when the filters do not line up with the counter buckets
+    """
+    C = TaskStatsCounterDB
+    if due_date_at_start is not None or due_date_at_end is not None:
+        return None
+    if group_by is not None and group_by not in COUNTER_GROUP_COLUMNS:
+        return None
+    filters = []
+    if created_by is not None:
+        filters.append(C.created_by == created_by)
+    if assigned_to is not None:
+        filters.append(C.assigned_to == assigned_to)
+    if completed is not None:
+        filters.append(C.completed == completed)
+    if created_at_start is not None:
+        if not is_day_boundary(created_at_start):
+            return None
+        filters.append(C.day >= as_date(created_at_start))
+    if created_at_end is not None:
+        if not is_day_boundary(created_at_end):
+            return None
+        filters.append(C.day < as_date(created_at_end))
+    return filters
+
+
+async def compute_task_stats_from_counters(
+    session, filters: list, task_filters: list, group_by: StatsGroupBy | None, priorities: DimensionTable
+) -> dict:
+    """
+    same result as compute_task_stats, totals are read from the counters and only the
+    overdue count (which depends on the current time) reads tasks, through the partial
+    index on the due_date of open tasks
+    """
+    C = TaskStatsCounterDB
+    now = datetime.now(timezone.utc)
+    total = func.coalesce(func.sum(C.count), 0).label("total")
+    completed = func.coalesce(func.sum(C.count).filter(C.completed == True), 0).label("completed")
+    overdue_filters = [*task_filters, TaskDB.completed == False, TaskDB.due_date < now]
+
+    if group_by is None:
+        row = (await session.exec(select(total, completed).where(*filters))).one()
+        overdue = (await session.exec(
+            select(func.count()).select_from(TaskDB).where(*overdue_filters))).one()
+        return { "detail": stats_detail(row.total, row.completed, overdue) }
+
+    key = COUNTER_GROUP_COLUMNS[group_by].label("key")
+    rows = (await session.exec(
+        select(key, total, completed)
+            .where(*filters)
+            .group_by(key)
+            .having(func.sum(C.count) != 0)
+            .order_by(key))).all()
+    task_key = group_by_expression(group_by, session.bind.dialect.name).label("key")
+    overdue_rows = (await session.exec(
+        select(task_key, func.count().label("overdue"))
+            .select_from(TaskDB)
+            .where(*overdue_filters)
+            .group_by(task_key))).all()
+    overdue = { group_key(row.key, group_by, priorities): row.overdue for row in overdue_rows }
+    groups = []
+    for row in rows:
+        row_key = group_key(row.key, group_by, priorities)
+        groups.append({ "key": row_key, **stats_detail(row.total, row.completed, overdue.get(row_key, 0)) })
+    return {
+        "detail": stats_detail(
+            sum(row.total for row in rows),
+            sum(row.completed for row in rows),
+            sum(overdue.values())),
+        "group_by": group_by,
+        "groups": groups,
+    }
+
+
+async def rebuild_task_counters(session, check_only: bool = False) -> list:
+    """
+    recomputes the counters from the tasks table and returns the drift found
+    as (key, counted, expected). unless check_only the counters are replaced,
+    the caller commits.
+    """
+    C = TaskStatsCounterDB
+    if session.bind.dialect.name == "postgresql":
+        # no task is written while the counters are recomputed
+        await session.exec(text("LOCK TABLE tasks IN SHARE MODE"))
+
+    day = func.date(TaskDB.created_at)
+    expected_rows = (await session.exec(
+        select(TaskDB.created_by, TaskDB.assigned_to, TaskDB.priority_id, TaskDB.completed,
+               day.label("day"), func.count().label("count"))
+            .group_by(TaskDB.created_by, TaskDB.assigned_to, TaskDB.priority_id, TaskDB.completed, day))).all()
+    expected = Counter()
+    for row in expected_rows:
+        expected[(row.created_by, row.assigned_to, row.priority_id, bool(row.completed), as_date(row.day))] += row.count
+
+    counted_rows = (await session.exec(
+        select(C.created_by, C.assigned_to, C.priority_id, C.completed, C.day, func.sum(C.count).label("count"))
+            .group_by(C.created_by, C.assigned_to, C.priority_id, C.completed, C.day))).all()
+    counted = Counter()
+    for row in counted_rows:
+        counted[(row.created_by, row.assigned_to, row.priority_id, bool(row.completed), as_date(row.day))] += row.count
+
+    drift = [
+        (key, counted.get(key, 0), expected.get(key, 0))
+        for key in sorted(set(expected) | set(counted), key=str)
+        if counted.get(key, 0) != expected.get(key, 0)
+    ]
+    if not check_only:
+        await session.exec(delete(C))
+        if expected:
+            await session.exec(insert(C).values([
+                {
+                    "created_by": created_by,
+                    "assigned_to": assigned_to,
+                    "priority_id": priority_id,
+                    "completed": completed,
+                    "day": day,
+                    "count": count,
+                }
+                for (created_by, assigned_to, priority_id, completed, day), count in expected.items()
+            ]))
+    return drift
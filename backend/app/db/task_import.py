@@ -0,0 +1,181 @@
+import codecs
+import csv
+import json
+import time
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from pydantic import ValidationError
+from sqlmodel import insert
+
+from app.core.config import TASK_IMPORT_CHUNK_SIZE
+from app.db.bulk import existing_user_ids, validation_detail
+from app.db.export import ExportFormat
+from app.db.stats import bump_task_counters, counter_deltas
+from app.db.tasks import invalid_task_fields, resolve_priorities
+from app.models.task import TaskCreate, TaskDB, TaskImportRejected, TaskImportResult
+from app.models.types import to_naive_utc
+
+
+# columns loaded by the import, in the order of the COPY records
+IMPORT_COLUMNS = (
+    "title",
+    "description",
+    "assigned_to",
+    "created_at",
+    "due_date",
+    "completed",
+    "created_by",
+    "updated_at",
+    "priority_id",
+)
+
+
+async def iter_lines(chunks):
+    """
+    numbered text lines of a byte stream, decoded as they arrive
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            number += 1
+            yield number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+
+async def iter_ndjson_records(lines):
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, "Invalid JSON"
+            continue
+        yield number, record if isinstance(record, dict) else "Expected a JSON object"
+
+
+async def iter_csv_records(lines):
+    """
+    rows of a csv with a header line. a record is complete when its quotes are
+    balanced, quoted values may hold newlines. empty values are read as null.
+    """
+    header = None
+    record, first = [], None
+    async for number, line in lines:
+        if not record:
+            first = number
+        record.append(line)
+        if sum(part.count('"') for part in record) % 2:
+            continue
+        text = "\n".join(record)
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = values
+        elif len(values) != len(header):
+            yield first, f"Expected {len(header)} values, got {len(values)}"
+        else:
+            yield first, { key: value if value != "" else None for key, value in zip(header, values) }
+    if record:
+        yield first, "Unterminated quoted value"
+
+
+async def load_chunk(session, chunk: list, created_by: int, rejected: list) -> int:
+    """
+    validates a chunk of (line, record) and loads the valid rows, COPY on
+    postgresql and a batched insert elsewhere. commits, returns the rows loaded.
+    """
+    parsed = []
+    for line, record in chunk:
+        if isinstance(record, str):
+            rejected.append(TaskImportRejected(line=line, detail=record))
+            continue
+        try:
+            task = TaskCreate.model_validate(record)
+        except ValidationError as e:
+            rejected.append(TaskImportRejected(line=line, detail=validation_detail(e)))
+            continue
+        parsed.append((line, task))
+
+    priorities = await resolve_priorities({task.priority for _, task in parsed}, session)
+    users = await existing_user_ids(session, {task.assigned_to for _, task in parsed})
+    current_time = datetime.now(timezone.utc)
+    values = []
+    for line, task in parsed:
+        priority_id = priorities.id(task.priority)
+        if invalid_task_fields(task):
+            rejected.append(TaskImportRejected(line=line, detail=invalid_task_fields(task)))
+        elif task.priority is not None and priority_id is None:
+            rejected.append(TaskImportRejected(line=line, detail="Priority not found"))
+        elif task.assigned_to is not None and task.assigned_to not in users:
+            rejected.append(TaskImportRejected(line=line, detail="User not found"))
+        else:
+            values.append({
+                "title": task.title,
+                "description": task.description,
+                "assigned_to": task.assigned_to,
+                # legacy tasks keep their creation time
+                "created_at": task.created_at if "created_at" in task.model_fields_set else current_time,
+                "due_date": task.due_date,
+                "completed": task.completed,
+                "created_by": created_by,
+                "updated_at": current_time,
+                "priority_id": priority_id,
+            })
+    if not values:
+        return 0
+
+    # counters first: the statement opens the transaction the COPY then runs in
+    await bump_task_counters(session, counter_deltas(added=[SimpleNamespace(**value) for value in values]))
+    if session.bind.dialect.name == "postgresql":
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        # COPY skips the column types, timestamps are stored naive utc like UTCDateTime does
+        await raw_connection.driver_connection.copy_records_to_table(
+            TaskDB.__tablename__,
+            columns=IMPORT_COLUMNS,
+            records=[
+                tuple(to_naive_utc(value[column]) if isinstance(value[column], datetime) else value[column]
+                      for column in IMPORT_COLUMNS)
+                for value in values
+            ])
+    else:
+        await session.exec(insert(TaskDB), params=values)
+    await session.commit()
+    return len(values)
+
+
+async def import_tasks(session, stream, format: ExportFormat, created_by: int) -> TaskImportResult:
+    """
+    reads the upload as it arrives and loads it TASK_IMPORT_CHUNK_SIZE rows per
+    transaction, only one chunk is held in memory
+    """
+    started = time.perf_counter()
+    records = iter_csv_records(iter_lines(stream)) if format == "csv" else iter_ndjson_records(iter_lines(stream))
+    imported = 0
+    rejected = []
+    chunk = []
+    async for line, record in records:
+        chunk.append((line, record))
+        if len(chunk) >= TASK_IMPORT_CHUNK_SIZE:
+            imported += await load_chunk(session, chunk, created_by, rejected)
+            chunk = []
+    if chunk:
+        imported += await load_chunk(session, chunk, created_by, rejected)
+    seconds = time.perf_counter() - started
+    return TaskImportResult(
+        imported=imported,
+        rejected=sorted(rejected, key=lambda item: item.line),
+        seconds=round(seconds, 3),
+        rows_per_second=round(imported / seconds, 1) if seconds > 0 else 0.0,
+    )
@@ -1,39 +1,233 @@
 from typing import Annotated
 
 from fastapi import Depends, HTTPException
+from sqlalchemy import literal
 from sqlmodel import select
 
-from app.models.task import TaskPriority, TaskDB, TaskCommentDB
+from app.core.etag import make_etag, timestamp_token
+from app.core.pagination import keyset_after
+
+from app.models.task import TaskCreate, TaskPriority, TaskDB, TaskCommentDB, TaskPublic, TaskUpdate
 from app.db.database import SessionDep, get_session
+from app.db.dimensions import DimensionTable, task_priorities
+
+
+def invalid_task_fields(task: TaskCreate | TaskUpdate) -> str | None:
+    """
+    the task models accept null where the tasks table does not: a new task needs
+    a title and a due_date, an update can not set a not null column to null.
+    checked by the single and the bulk routes and the import alike (422)
+    """
+    if isinstance(task, TaskCreate):
+        for field in ("title", "due_date"):
+            if getattr(task, field) is None:
+                return f"{field} is required"
+    for field in ("title", "due_date", "completed", "created_by"):
+        if field in task.model_fields_set and getattr(task, field) is None:
+            return f"{field} can not be null"
+    return None
+
+
+def check_task_fields(task: TaskCreate | TaskUpdate):
+    if invalid_task_fields(task):
+        raise HTTPException(status_code=422, detail=invalid_task_fields(task))
+
+
+async def get_task_priorities(
+    session: Annotated[SessionDep, Depends(get_session)]
+    ) -> DimensionTable:
+    await task_priorities.ensure_loaded(session)
+    return task_priorities
+
+
+TaskPrioritiesDep = Annotated[DimensionTable, Depends(get_task_priorities)]
 
 
 async def priority_desc(
-    desc: str,
+    desc: str | None,
     session: Annotated[SessionDep, Depends(get_session)]
-    ) -> TaskPriority:
-    priority = session.exec(
-            select(TaskPriority).where(TaskPriority.desc==desc)).first()
-    if not priority:
-        return HTTPException(status_code=404, detail="Priority not found")
-    return priority
+    ) -> TaskPriority | None:
+    if desc is None:
+        return None
+    priorities = await get_task_priorities(session)
+    if priorities.id(desc) is None:
+        # the row may have been added after the table was loaded
+        await priorities.reload_missing(session)
+    if priorities.id(desc) is None:
+        raise HTTPException(status_code=404, detail="Priority not found")
+    return TaskPriority(id=priorities.id(desc), desc=desc)
 
 
 async def priority_id(
-    priority_id: id,
+    priority_id: int | None,
     session: Annotated[SessionDep, Depends(get_session)]
-    ) -> TaskPriority:
-    priority =  session.exec(
-            select(TaskPriority).where(TaskPriority.id==priority_id)).first()
-    if not priority:
-        return HTTPException(status_code=404, detail="Priority not found")
-    return priority
+    ) -> TaskPriority | None:
+    if priority_id is None:
+        return None
+    priorities = await get_task_priorities(session)
+    if priorities.desc(priority_id) is None:
+        await priorities.reload_missing(session)
+    if priorities.desc(priority_id) is None:
+        raise HTTPException(status_code=404, detail="Priority not found")
+    return TaskPriority(id=priority_id, desc=priorities.desc(priority_id))
+
+
+async def resolve_priorities(
+    descs,
+    session: Annotated[SessionDep, Depends(get_session)]
+    ) -> DimensionTable:
+    """
+    priorities of a whole batch: the table is reloaded at most once when a desc is unknown
+    """
+    priorities = await get_task_priorities(session)
+    if any(desc is not None and priorities.id(desc) is None for desc in descs):
+        await priorities.reload_missing(session)
+    return priorities
+
+
+# exactly the columns of TaskPublic (priority comes from the dimension registry),
+# selected as plain rows so no TaskDB object or relationship is loaded
+TASK_PUBLIC_COLUMNS = (
+    TaskDB.id,
+    TaskDB.title,
+    TaskDB.description,
+    TaskDB.assigned_to,
+    TaskDB.created_by,
+    TaskDB.created_at,
+    TaskDB.due_date,
+    TaskDB.completed,
+    TaskDB.updated_at,
+    TaskDB.priority_id,
+    TaskDB.comment_count,
+    TaskDB.last_comment_at,
+)
+
+
+def select_task_public():
+    return select(*TASK_PUBLIC_COLUMNS)
+
+
+def task_filters(created_by: int | None, assigned_to: int | None, completed: bool | None) -> list:
+    """
+    where clauses of the GET /tasks/ filters
+    """
+    filters = []
+    if created_by is not None:
+        filters.append(TaskDB.created_by == created_by)
+    if assigned_to is not None:
+        filters.append(TaskDB.assigned_to == assigned_to)
+    if completed is not None:
+        filters.append(TaskDB.completed == completed)
+    return filters
+
+
+def to_task_public(task, priorities: DimensionTable) -> TaskPublic:
+    """
+    TaskPublic of a TaskDB object or of a row of TASK_PUBLIC_COLUMNS
+    """
+    return TaskPublic(
+        id=task.id,
+        title=task.title,
+        description=task.description,
+        assigned_to=task.assigned_to,
+        created_by=task.created_by,
+        created_at=task.created_at,
+        due_date=task.due_date,
+        completed=task.completed,
+        updated_at=task.updated_at,
+        priority=priorities.desc(task.priority_id),
+        comment_count=task.comment_count,
+        last_comment_at=task.last_comment_at,
+    )
+
+
+def task_public_document(task, priorities: DimensionTable) -> dict:
+    """
+    to_task_public as a plain dict (TaskPublic keys and order) for json_response,
+    the row comes from the database so no model is built or validated
+    """
+    return {
+        "title": task.title,
+        "description": task.description,
+        "assigned_to": task.assigned_to,
+        "created_at": task.created_at,
+        "due_date": task.due_date,
+        "completed": task.completed,
+        "id": task.id,
+        "created_by": task.created_by,
+        "updated_at": task.updated_at,
+        "priority": priorities.desc(task.priority_id),
+        "comment_count": task.comment_count,
+        "last_comment_at": task.last_comment_at,
+    }
+
+
+def task_cache_key(task_id: int) -> str:
+    return f"task:{task_id}"
+
+
+def task_comments_cache_key(task_id: int) -> str:
+    # first page of the comments with its next cursor
+    return f"task_comments:{task_id}:first"
+
+
+# what a task etag is computed from, the comment activity changes without updated_at
+TASK_VERSION_COLUMNS = (TaskDB.id, TaskDB.updated_at, TaskDB.comment_count, TaskDB.last_comment_at)
+
+
+def task_etag(task) -> str:
+    """
+    etag of a cached TaskPublic document or of a row of TASK_VERSION_COLUMNS
+    """
+    version = task if isinstance(task, dict) else task._mapping
+    return make_etag(
+        "task", version["id"], timestamp_token(version["updated_at"]),
+        version["comment_count"], timestamp_token(version["last_comment_at"]))
+
+
+def task_comments_etag(task_id: int, comments, has_more: bool = False) -> str:
+    """
+    digest of the (id, updated_at) of a page of comments, taken from rows or cached dicts
+    """
+    versions = sorted(
+        (c["id"], timestamp_token(c["updated_at"])) if isinstance(c, dict) else (c.id, timestamp_token(c.updated_at))
+        for c in comments
+    )
+    return make_etag("task_comments", task_id, has_more, *(f"{id}@{updated_at}" for id, updated_at in versions))
+
+
+def task_comments_page(query, after: list | None, limit: int):
+    """
+    keyset page of comments ordered by (created_at, id), one extra row tells if there is a next page
+    """
+    if after is not None:
+        query = query.where(keyset_after([TaskCommentDB.created_at, TaskCommentDB.id], after))
+    return query.order_by(TaskCommentDB.created_at, TaskCommentDB.id).limit(limit + 1)
+
+
+async def get_task_comments_versions(task_id: int, session, after: list | None, limit: int) -> list:
+    """
+    (id, updated_at) of a page of comments of a task without loading them,
+    404 when the task does not exist
+    """
+    page = task_comments_page(
+        select(TaskCommentDB.id, TaskCommentDB.updated_at).where(TaskCommentDB.task_id == task_id),
+        after, limit).subquery()
+    rows = (await session.exec(
+        select(TaskDB.id.label("task_id"), page.c.id, page.c.updated_at)
+            .select_from(TaskDB)
+            .outerjoin(page, literal(True))
+            .where(TaskDB.id == task_id))).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return [row for row in rows if row.id is not None]
 
 
 async def get_current_task(
     task_id: int,
     session: Annotated[SessionDep, Depends(get_session)]
     ):
-    task = session.exec(select(TaskDB).where(TaskDB.id == task_id)).first()
+    task = (await session.exec(select(TaskDB).where(TaskDB.id == task_id))).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
@@ -45,12 +239,10 @@ async def get_current_task_comment(
     task: Annotated[TaskDB, Depends(get_current_task)],
     session: Annotated[SessionDep, Depends(get_session)]
     ):
-    task_comment = session.exec(
+    task_comment = (await session.exec(
         select(TaskCommentDB)
             .where(TaskCommentDB.task_id == task_id)
-            .where(TaskCommentDB.id == task_comment_id)).first()
+            .where(TaskCommentDB.id == task_comment_id))).first()
     if not task_comment:
         raise HTTPException(status_code=404, detail="Task Comentary not found")
     return task_comment
-         
-    
@@ -1,30 +1,56 @@
 from typing import Annotated
 
-import jwt
-
 from fastapi import Depends, HTTPException, status
 from jwt.exceptions import InvalidTokenError
 from sqlmodel import select
 
-from app.core.config import HASH_ALGORITHM, SECRET_KEY
-from app.core.security import verify_password, oauth2_scheme
-from app.db.database import get_session
+from app.core.cache import cache_invalidator, TTLCache
+from app.core.config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS
+from app.core.etag import make_etag
+from app.core.security import decode_access_token, verify_and_update_password, oauth2_scheme
+from app.db.database import SessionDep
 from app.models.token import TokenData
 from app.models.user import UserPublic, UserDB
 
 
+# username -> UserPublic, saves the users lookup of every authenticated request
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+cache_invalidator.register("principal", principal_cache)
+
+
+async def invalidate_principal(username: str):
+    await cache_invalidator.invalidate("principal", username)
+
+
+def user_cache_key(user_id: int) -> str:
+    return f"user:{user_id}"
 
-async def authenticate_user(username: str, password: str):
-    user = await get_user_by_username(username)
+
+def user_etag(user: dict) -> str:
+    """
+    users have no updated_at, the etag is a digest of the public fields
+    """
+    return make_etag("user", *(f"{key}={user[key]}" for key in sorted(user)))
+
+
+async def authenticate_user(username: str, password: str, session: SessionDep):
+    user = await get_user_by_username(username, session)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash:
+        # rehash on login, old bcrypt hashes are replaced by argon2
+        user.hashed_password = new_hash
+        session.add(user)
+        await session.commit()
     return user
 
 
 async def get_current_user(
         token: Annotated[str, Depends(oauth2_scheme)],
+        session: SessionDep,
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -32,16 +58,21 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[HASH_ALGORITHM])
+        payload = await decode_access_token(token)
         username = payload.get("sub")
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
-    user = await get_user_by_username(token_data.username)
+    generation = principal_cache.generation
+    user = principal_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        user_db = await get_user_by_username(token_data.username, session)
+        if user_db is None:
+            raise credentials_exception
+        user = UserPublic.model_validate(user_db)
+        principal_cache.set(token_data.username, user, generation=generation)
     return user
 
 
@@ -61,12 +92,11 @@ async def get_current_active_admin_user(
     return current_user
 
 
-async def get_user_by_username(username):
-    s = next(get_session())
-    exists = s.exec(
+async def get_user_by_username(username, session: SessionDep):
+    exists = (await session.exec(
         select(UserDB)
         .where(UserDB.username == username)
-    ).first()
+    )).first()
     if not exists:
         return None
     return exists
@@ -1,10 +1,15 @@
-from contextlib import asynccontextmanager
+import asyncio
+
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
+from app.core.cache import cache_invalidator
 from app.core.cors import add_cors_middleware
-from app.core.rate_limiter import startup_redis
-from app.db.database import create_db_and_tables, fill_task_priority_table, create_super_user
+from app.core.redis import close_redis
+from app.core.startup import startup_timer
+from app.db.database import bootstrap, check_migrations
+from app.db.dimensions import load_dimensions
 from app.routes.root import root_routers
 from app.routes.tasks import tasks_routers
 from app.routes.token import token_routes
@@ -14,11 +19,20 @@ from app.routes.users import users_routers
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    startup_redis()
-    create_db_and_tables()
-    fill_task_priority_table()
-    create_super_user()
+    startup_timer.start()
+    with startup_timer.step("migrations"):
+        await check_migrations()
+    with startup_timer.step("bootstrap"):
+        await bootstrap()
+    with startup_timer.step("dimensions"):
+        await load_dimensions()
+    startup_timer.finish()
+    invalidation_listener = asyncio.create_task(cache_invalidator.listen())
     yield
+    invalidation_listener.cancel()
+    with suppress(asyncio.CancelledError):
+        await invalidation_listener
+    await close_redis()
 
 
 app = FastAPI(lifespan=lifespan)
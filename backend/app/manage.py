@@ -0,0 +1,71 @@
+"""
+maintenance commands
+
+    python -m app.manage migrate [--check]
+    python -m app.manage rebuild-stats [--check]
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db.database import bootstrap, db_config, engine
+from app.db.migrations import migrate, pending_migrations
+from app.db.stats import rebuild_task_counters
+
+
+async def rebuild_stats(check_only: bool) -> int:
+    async with AsyncSession(engine, **db_config) as session:
+        drift = await rebuild_task_counters(session, check_only=check_only)
+        if not check_only:
+            await session.commit()
+    await engine.dispose()
+
+    for key, counted, expected in drift:
+        print(f"drift {key}: counted {counted}, expected {expected}")
+    if check_only:
+        print(f"{len(drift)} counter buckets drifted")
+        return 1 if drift else 0
+    print(f"counters rebuilt, {len(drift)} counter buckets fixed")
+    return 0
+
+
+async def run_migrations(check_only: bool) -> int:
+    if check_only:
+        async with engine.connect() as conn:
+            pending = await pending_migrations(conn)
+        await engine.dispose()
+        for m in pending:
+            print(f"pending {m.version}: {m.name}")
+        print(f"{len(pending)} pending migrations")
+        return 1 if pending else 0
+    applied = await migrate(engine)
+    await bootstrap()
+    await engine.dispose()
+    for m in applied:
+        print(f"applied {m.version}: {m.name}")
+    print(f"{len(applied)} migrations applied")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_command = commands.add_parser("migrate", help="apply the pending schema migrations and seed rows")
+    migrate_command.add_argument("--check", action="store_true", help="only list the pending migrations")
+
+    rebuild = commands.add_parser("rebuild-stats", help="recompute the task statistics counters")
+    rebuild.add_argument("--check", action="store_true", help="only report the drift, change nothing")
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        return asyncio.run(run_migrations(args.check))
+    if args.command == "rebuild-stats":
+        return asyncio.run(rebuild_stats(args.check))
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
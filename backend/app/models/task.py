@@ -1,10 +1,12 @@
-from datetime import datetime, timezone
-from typing import List
+from datetime import date, datetime, timezone
+from typing import Any, List
 
+from sqlalchemy import Index, text
 from sqlmodel import Field, ForeignKey, SQLModel, Relationship
 from sqlmodel import Session, select
 
-from app.models.user import UserDB
+from app.models.types import UTCDateTime
+from app.models.user import UserDB, UserPublic
 
 
 # dim tables
@@ -40,17 +42,25 @@ class TaskBase(SQLModel):
 class TaskDB(TaskBase, table=True):
 
     __tablename__ = "tasks"
+    __table_args__ = (
+        # overdue counts of the statistics (not completed and due_date before now)
+        Index("ix_tasks_open_due_date", "due_date",
+              postgresql_where=text("NOT completed"), sqlite_where=text("completed = 0")),
+    )
 
     id : int | None = Field(default=None, primary_key=True)
     title : str = Field(nullable=None)
     description : str | None = Field(default=None)
-    created_at : datetime = Field(nullable=False, index=True)
-    due_date : datetime = Field(index=True)
+    created_at : datetime = Field(nullable=False, index=True, sa_type=UTCDateTime)
+    due_date : datetime = Field(index=True, sa_type=UTCDateTime)
     priority_id : int | None = Field(foreign_key="task_priority.id", nullable=True)
     created_by : int =  Field(foreign_key="users.id", nullable=False)
     assigned_to : int | None = Field(foreign_key="users.id", nullable=True)
-    updated_at : datetime = Field(default=None)
+    updated_at : datetime = Field(default=None, sa_type=UTCDateTime)
     completed : bool = Field(default=False, nullable=False)
+    # comment activity, maintained by the comment routes
+    comment_count : int = Field(default=0, nullable=False, sa_column_kwargs={"server_default": "0"})
+    last_comment_at : datetime | None = Field(default=None, sa_type=UTCDateTime)
 
     priority: "TaskPriority" = Relationship(back_populates="tasks")
 
@@ -58,8 +68,11 @@ class TaskDB(TaskBase, table=True):
 
 class TaskPublic(TaskBase):
     id : int | None
+    created_by : int | None = None
     updated_at : datetime = Field(default=None)
     priority : str | None
+    comment_count : int = 0
+    last_comment_at : datetime | None = None
 
 
 class TaskCreate(TaskBase):
@@ -78,6 +91,54 @@ class TaskUpdate(TaskBase):
     completed : bool | None = None
 
 
+# bulk operations
+
+class TaskBulkItemResult(SQLModel):
+    index : int
+    id : int | None = None
+    status : int
+    task : TaskPublic | None = None
+    detail : Any = None
+
+
+class TaskBulkResult(SQLModel):
+    succeeded : int
+    failed : int
+    results : List[TaskBulkItemResult]
+
+
+class TaskImportRejected(SQLModel):
+    line : int
+    detail : Any = None
+
+
+class TaskImportResult(SQLModel):
+    imported : int
+    rejected : List[TaskImportRejected]
+    seconds : float
+    rows_per_second : float
+
+
+# task statistics
+
+class TaskStatsCounterDB(SQLModel, table=True):
+    """
+    number of tasks per (created_by, assigned_to, priority_id, completed, day of created_at),
+    maintained in the transactions that write tasks. counts are summed on read,
+    so two rows with the same key are harmless.
+    """
+
+    __tablename__ = "task_stats_counters"
+
+    id : int | None = Field(default=None, primary_key=True)
+    created_by : int = Field(nullable=False, index=True)
+    assigned_to : int | None = Field(default=None, index=True)
+    priority_id : int | None = Field(default=None)
+    completed : bool = Field(nullable=False)
+    day : date = Field(nullable=False, index=True)
+    count : int = Field(default=0, nullable=False)
+
+
 # task comments
 
 class TaskCommentBase(SQLModel):
@@ -89,13 +150,17 @@ class TaskCommentBase(SQLModel):
 class TaskCommentDB(TaskCommentBase, table=True):
     
     __tablename__ = "comments"
+    __table_args__ = (
+        # keyset pagination of the comments of a task
+        Index("ix_comments_task_id_created_at", "task_id", "created_at", "id"),
+    )
 
     id : int | None = Field(default=None, primary_key=True)
     task_id : int =  Field(foreign_key="tasks.id", nullable=False, index=True)
     description : str = Field(nullable=False)
     created_by : int =  Field(foreign_key="users.id", nullable=False)
-    created_at : datetime = Field(nullable=False, index=True)
-    updated_at : datetime = Field(nullable=False, index=True)
+    created_at : datetime = Field(nullable=False, index=True, sa_type=UTCDateTime)
+    updated_at : datetime = Field(nullable=False, index=True, sa_type=UTCDateTime)
 
 
 class TaskCommentCreate(TaskCommentBase):
@@ -110,3 +175,22 @@ class TaskCommentPublic(TaskCommentBase):
     id : int
     updated_at : datetime = None
     created_at : datetime = None
+
+
+# compound documents
+
+class TaskWithIncludes(TaskPublic):
+    """
+    TaskPublic with the related rows asked for with include=
+    """
+    comments : List[TaskCommentPublic] | None = None
+    assignee : UserPublic | None = None
+    creator : UserPublic | None = None
+
+
+# multi-get
+
+class TaskMultiGetResult(SQLModel):
+    # in the order of the requested ids, null for a missing task
+    results : List[TaskPublic | None]
+    missing : List[int]
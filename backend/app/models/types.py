@@ -0,0 +1,25 @@
+from datetime import timezone
+
+from sqlalchemy import DateTime
+from sqlalchemy.types import TypeDecorator
+
+
+def to_naive_utc(value):
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class UTCDateTime(TypeDecorator):
+    """
+    timestamp without time zone holding utc values.
+
+    asyncpg refuses aware datetimes for timestamp columns, they are converted
+    to utc and stored naive.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_naive_utc(value)
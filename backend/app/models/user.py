@@ -1,3 +1,5 @@
+from typing import List
+
 from sqlmodel import Field, SQLModel
 
 
@@ -34,3 +36,9 @@ class UserUpdate(UserBase):
     enabled: bool | None = None
     isadmin: bool | None = None
     password: str | None = None
+
+
+class UserMultiGetResult(SQLModel):
+    # in the order of the requested ids, null for a missing user
+    results : List[UserPublic | None]
+    missing : List[int]
@@ -1,6 +1,26 @@
+from typing import Annotated
+
 from fastapi import APIRouter, Depends
 
+from app.core.cache import read_cache
+from app.core.rate_limiter import rate_limiter
+from app.core.startup import startup_timer
+from app.db.database import engine
+from app.db.pool import get_pool_stats
+from app.db.users import get_current_active_admin_user
+from app.models.user import UserPublic
+
 
 root_routers = APIRouter(prefix="/root", tags=["users"])
 
 
+@root_routers.get("/stats")
+async def get_stats(
+    current_user: Annotated[UserPublic, Depends(get_current_active_admin_user)],
+):
+    return {
+        "pool": get_pool_stats(engine),
+        "cache": read_cache.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "startup": startup_timer.stats(),
+    }
@@ -1,15 +1,37 @@
 from datetime import datetime, timezone
-from typing import Annotated, List, Optional
-
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import select, delete
-
-
-from app.core.rate_limiter import get_rate_limiter
+from typing import Annotated, List, Literal, Optional
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func
+from sqlmodel import delete, insert, select, update
+
+
+from app.core.cache import read_cache
+from app.core.config import MULTI_GET_MAX_IDS, RATE_LIMIT_EXPENSIVE_MINUTE, TASK_BULK_MAX_ITEMS
+from app.core.etag import ETAG_HEADER, etag_matches, not_modified
+from app.core.pagination import decode_cursor, encode_cursor, keyset_after, NEXT_CURSOR_HEADER
+from app.core.rate_limiter import get_rate_limiter, rate_limit
+from app.core.responses import json_response, response_headers
+from app.db.bulk import bulk_create_tasks, bulk_delete_tasks, bulk_update_tasks
 from app.db.database import SessionDep
+from app.db.search import search_condition_and_rank
+from app.db.multiget import check_ids, get_tasks_by_ids, parse_ids
+from app.db.fields import COMMENT_FIELDS, comment_document, parse_fields, project, projection_columns
+from app.db.fields import task_document, TASK_FIELDS
+from app.db.includes import add_task_includes, INCLUDE_KEY_FIELDS, parse_includes
+from app.db.export import EXPORT_MEDIA_TYPES, export_tasks, ExportFormat
+from app.db.stats import bump_task_counters, compute_task_stats, compute_task_stats_from_counters, counter_deltas
+from app.db.stats import counter_filters, StatsGroupBy, TASK_COUNTER_COLUMNS, TASK_COUNTER_FIELDS
 from app.db.users import get_current_active_user
-from app.db.tasks import priority_desc, get_current_task, get_current_task_comment
-from app.models.task import TaskCreate, TaskDB, TaskPublic, TaskUpdate
+from app.db.tasks import check_task_fields, priority_desc, get_current_task, get_current_task_comment
+from app.db.tasks import select_task_public, TaskPrioritiesDep, TASK_PUBLIC_COLUMNS, task_public_document, to_task_public
+from app.db.tasks import task_cache_key, task_comments_cache_key, task_etag, task_comments_etag
+from app.db.tasks import get_task_comments_versions, task_comments_page, task_filters, TASK_VERSION_COLUMNS
+from app.db.task_import import import_tasks
+from app.models.task import TaskBulkResult, TaskCreate, TaskDB, TaskImportResult, TaskPublic, TaskUpdate, TaskWithIncludes
+from app.models.task import TaskMultiGetResult
 from app.models.task import TaskCommentCreate, TaskCommentPublic, TaskCommentDB, TaskCommentUpdate
 from app.models.user import UserPublic
 
@@ -20,57 +42,344 @@ tasks_routers = APIRouter(prefix="/tasks", tags=["task"], dependencies=[Depends(
 # task 
 # -------------------------------------------------------------------------------------------------
 
-@tasks_routers.get("/", response_model=List[TaskPublic])
+# sortable columns of GET /tasks/ (both indexed), id breaks the ties
+TASK_SORT_COLUMNS = {
+    "created_at": TaskDB.created_at,
+    "due_date": TaskDB.due_date,
+}
+
+
+# the response models of the read routes document the schema, the documents are
+# built from the rows and sent with json_response (serialized once, not validated).
+# the include= fields are only in the response when asked for
+@tasks_routers.get("/", response_model=List[TaskWithIncludes], response_model_exclude_unset=True)
+@rate_limit(cost=2)
 async def get_tasks(
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
+    response: Response,
     offset: int = 0,
-    limit: Annotated[int, Query(le=20)] = 20,
+    limit: Annotated[int, Query(ge=1, le=20)] = 20,
     created_by: Optional[int] = None,
     assigned_to: Optional[int] = None,
-    completed : Optional[bool] = None
+    completed : Optional[bool] = None,
+    cursor: Optional[str] = None,
+    sort_by: Literal["created_at", "due_date"] = "created_at",
+    order: Literal["asc", "desc"] = "asc",
+    include: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> List[TaskWithIncludes]:
+    """
+    keyset pagination: the X-Next-Cursor response header holds the cursor of the
+    next page (absent on the last one), offset is only used without cursor.
+    include=comments,assignee,creator embeds the related rows.
+    fields=id,title,... selects only those columns and keys.
+    """
+    includes = parse_includes(include)
+    field_names = parse_fields(fields, TASK_FIELDS)
+    sort_column = TASK_SORT_COLUMNS[sort_by]
+    descending = order == "desc"
+    cursor_key = f"{sort_by}:{order}"
+    if field_names is None:
+        query = select_task_public()
+    else:
+        # the includes and the cursor read a few more columns than asked for
+        document_names = list(dict.fromkeys([*field_names, *(INCLUDE_KEY_FIELDS[name] for name in includes)]))
+        query = select(*projection_columns(TASK_FIELDS, document_names, [TaskDB.id, sort_column]))
+    query = query.where(*task_filters(created_by, assigned_to, completed))
+
+    if cursor is not None:
+        last_value, last_id = decode_cursor(cursor, cursor_key, (datetime, int))
+        query = query.where(
+            keyset_after([sort_column, TaskDB.id], [last_value, last_id], descending))
+    else:
+        query = query.offset(offset)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), TaskDB.id.desc())
+    else:
+        query = query.order_by(sort_column, TaskDB.id)
+    # one extra row tells if there is a next page
+    query = query.limit(limit + 1)
+    tasks = (await session.exec(query)).all()
+
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            cursor_key, [getattr(last, sort_by), last.id])
+
+    if field_names is not None:
+        documents = [ task_document(t, document_names, priorities) for t in tasks ]
+        documents = await add_task_includes(session, documents, includes)
+        return json_response(project(documents, [*field_names, *includes]), response)
+    documents = [ task_public_document(t, priorities) for t in tasks ]
+    return json_response(await add_task_includes(session, documents, includes), response)
+
+
+# declared before /{task_id}, otherwise "search" is matched as a task id
+@tasks_routers.get("/search", response_model=List[TaskPublic])
+@rate_limit(cost=5)
+async def search_tasks(
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
+    response: Response,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=20)] = 20,
+    created_by: Optional[int] = None,
+    assigned_to: Optional[int] = None,
+    completed : Optional[bool] = None,
+    include_comments: bool = False,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
 ) -> List[TaskPublic]:
-    query = select(TaskDB)
+    """
+    tasks whose title or description (and comments with include_comments) match q,
+    best ranked first. keyset paginated like GET /tasks/ (X-Next-Cursor header).
+    """
+    field_names = parse_fields(fields, TASK_FIELDS)
+    condition, rank = search_condition_and_rank(q, session.bind.dialect.name, include_comments)
+    rank = rank.label("rank")
+    columns = TASK_PUBLIC_COLUMNS if field_names is None else projection_columns(TASK_FIELDS, field_names, [TaskDB.id])
+    query = (
+        select(*columns, rank)
+            .where(condition, *task_filters(created_by, assigned_to, completed)))
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor, "search", (float, int))
+        query = query.where(keyset_after([rank, TaskDB.id], [last_rank, last_id], descending=True))
+    query = query.order_by(rank.desc(), TaskDB.id.desc()).limit(limit + 1)
+    tasks = (await session.exec(query)).all()
+
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor("search", [last.rank, last.id])
+
+    if field_names is not None:
+        return json_response(project([ task_document(t, field_names, priorities) for t in tasks ], field_names), response)
+    return json_response([ task_public_document(t, priorities) for t in tasks ], response)
+
+
+# declared before /{task_id}, otherwise "export" is matched as a task id
+@tasks_routers.get("/export")
+@rate_limit(cost=20, per_minute=RATE_LIMIT_EXPENSIVE_MINUTE)
+async def export_tasks_file(
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
+    response: Response,
+    format: ExportFormat = "ndjson",
+    created_by: Optional[int] = None,
+    assigned_to: Optional[int] = None,
+    completed : Optional[bool] = None,
+    sort_by: Literal["created_at", "due_date"] = "created_at",
+    order: Literal["asc", "desc"] = "asc",
+    include_comments: bool = False,
+):
+    """
+    every task matching the filters of GET /tasks/, streamed as ndjson or csv
+    """
+    sort_column = TASK_SORT_COLUMNS[sort_by]
+    query = select_task_public().where(*task_filters(created_by, assigned_to, completed))
+    if order == "desc":
+        query = query.order_by(sort_column.desc(), TaskDB.id.desc())
+    else:
+        query = query.order_by(sort_column, TaskDB.id)
+    return StreamingResponse(
+        export_tasks(query, format, include_comments, priorities),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            **response_headers(response),
+            "Content-Disposition": f'attachment; filename="tasks.{format}"',
+        })
 
-    if created_by is not None:
-        query = query.where(TaskDB.created_by == created_by)
 
-    if assigned_to is not None:
-        query = query.where(TaskDB.assigned_to == assigned_to)
+# -------------------------------------------------------------------------------------------------
+# statistic
+# -------------------------------------------------------------------------------------------------
 
+# declared before /{task_id}, otherwise "statistics" is matched as a task id
+@tasks_routers.get("/statistics")
+@rate_limit(cost=10, per_minute=RATE_LIMIT_EXPENSIVE_MINUTE)
+async def get_statistics(
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
+    created_by: Optional[int] = None,
+    assigned_to: Optional[int] = None,
+    completed : Optional[bool] = None,
+    created_at_start: Optional[datetime] = None,  # inclusive
+    created_at_end: Optional[datetime] = None,    # exclusive
+    due_date_at_start: Optional[datetime] = None,
+    due_date_at_end: Optional[datetime] = None,
+    group_by: Optional[StatsGroupBy] = None,
+):
+    filters = []
+    if created_by is not None:
+        filters.append(TaskDB.created_by == created_by)
+    if assigned_to is not None:
+        filters.append(TaskDB.assigned_to == assigned_to)
     if completed is not None:
-        query = query.where(TaskDB.completed == completed)
-
-    query = query.offset(offset).limit(limit)
-    tasks = session.exec(query).all()
-
-    return [
-        TaskPublic(
-            id=t.id,
-            title=t.title,
-            description=t.description,
-            assigned_to=t.assigned_to,
-            created_at=t.created_at,
-            due_date=t.due_date,
-            completed=t.completed,
-            updated_at=t.updated_at,
-            priority=t.priority.desc if t.priority else None,
-        )
-        for t in tasks
-    ]
-
-
-@tasks_routers.get("/{task_id}", response_model=TaskPublic)
+        filters.append(TaskDB.completed == completed)
+    if created_at_start is not None:
+        filters.append(TaskDB.created_at >= created_at_start)
+    if created_at_end is not None:
+        filters.append(TaskDB.created_at < created_at_end)
+    if due_date_at_start is not None:
+        filters.append(TaskDB.due_date >= due_date_at_start)
+    if due_date_at_end is not None:
+        filters.append(TaskDB.due_date < due_date_at_end)
+
+    # answered from the counters table when the filters line up with its buckets.
+    # total and completed come from the counters alone, overdue depends on the
+    # current time and still counts open tasks (index on their due_date)
+    counters = counter_filters(
+        created_by, assigned_to, completed, created_at_start, created_at_end,
+        due_date_at_start, due_date_at_end, group_by)
+    if counters is not None:
+        return await compute_task_stats_from_counters(session, counters, filters, group_by, priorities)
+    return await compute_task_stats(session, filters, group_by, priorities)
+
+# -------------------------------------------------------------------------------------------------
+# bulk (declared before /{task_id} as well)
+# -------------------------------------------------------------------------------------------------
+
+def bulk_result(results: list) -> TaskBulkResult:
+    succeeded = sum(1 for result in results if result.status == 200)
+    return TaskBulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+
+@tasks_routers.post("/bulk", response_model=TaskBulkResult)
+@rate_limit(cost=20, per_minute=RATE_LIMIT_EXPENSIVE_MINUTE)
+async def post_tasks_bulk(
+    tasks: Annotated[List[dict], Body(max_length=TASK_BULK_MAX_ITEMS)],
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+):
+    # items are validated one by one, the invalid ones are reported and skipped
+    results = await bulk_create_tasks(session, tasks, created_by=current_user.id)
+    await session.commit()
+    return bulk_result(results)
+
+
+@tasks_routers.patch("/bulk", response_model=TaskBulkResult)
+@rate_limit(cost=20, per_minute=RATE_LIMIT_EXPENSIVE_MINUTE)
+async def update_tasks_bulk(
+    tasks: Annotated[List[dict], Body(max_length=TASK_BULK_MAX_ITEMS)],
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+):
+    results = await bulk_update_tasks(session, tasks)
+    await session.commit()
+    await read_cache.delete(*[task_cache_key(result.id) for result in results if result.status == 200])
+    return bulk_result(results)
+
+
+@tasks_routers.delete("/bulk", response_model=TaskBulkResult)
+@rate_limit(cost=20, per_minute=RATE_LIMIT_EXPENSIVE_MINUTE)
+async def delete_tasks_bulk(
+    ids: Annotated[List[int], Body(max_length=TASK_BULK_MAX_ITEMS)],
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+):
+    results = await bulk_delete_tasks(session, ids)
+    await session.commit()
+    deleted = [result.id for result in results if result.status == 200]
+    await read_cache.delete(
+        *[task_cache_key(task_id) for task_id in deleted],
+        *[task_comments_cache_key(task_id) for task_id in deleted])
+    return bulk_result(results)
+
+
+@tasks_routers.post("/import", response_model=TaskImportResult)
+@rate_limit(cost=20, per_minute=RATE_LIMIT_EXPENSIVE_MINUTE)
+async def import_tasks_file(
+    request: Request,
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    format: ExportFormat = "ndjson",
+):
+    """
+    loads the tasks of an ndjson or csv body (same columns as the export),
+    the body is read as it is uploaded
+    """
+    return await import_tasks(session, request.stream(), format, created_by=current_user.id)
+
+# -------------------------------------------------------------------------------------------------
+# multi-get (declared before /{task_id} as well)
+# -------------------------------------------------------------------------------------------------
+
+@tasks_routers.get("/by-ids", response_model=TaskMultiGetResult)
+@rate_limit(cost=2)
+async def get_tasks_by_id_list(
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
+    ids: Annotated[str, Query(description="comma separated task ids")],
+):
+    """
+    tasks in the order of ids, through the read cache of GET /tasks/{task_id}
+    """
+    return await get_tasks_by_ids(session, parse_ids(ids), priorities)
+
+
+@tasks_routers.post("/by-ids", response_model=TaskMultiGetResult)
+@rate_limit(cost=2)
+async def post_tasks_by_id_list(
+    ids: Annotated[List[int], Body(max_length=MULTI_GET_MAX_IDS)],
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
+):
+    """
+    same as GET /tasks/by-ids for lists too long for a query string
+    """
+    check_ids(ids)
+    return await get_tasks_by_ids(session, ids, priorities)
+
+# -------------------------------------------------------------------------------------------------
+# single task
+# -------------------------------------------------------------------------------------------------
+
+@tasks_routers.get("/{task_id}", response_model=TaskWithIncludes, response_model_exclude_unset=True)
 async def get_task(
-    task: Annotated[TaskDB, Depends(get_current_task)],
     task_id: int,
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
+    response: Response,
+    include: Optional[str] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    
-    task_db_data = task.model_dump()
-    task_db_data["priority"] = task.priority.desc if task.priority else None
-    return TaskPublic.model_validate(task_db_data)
+    includes = parse_includes(include)
+    if includes:
+        # the etag only covers the task itself, a compound document is always sent
+        if_none_match = None
+    cache_key = task_cache_key(task_id)
+    task_public = await read_cache.get(cache_key)
+    if task_public is None:
+        generation = await read_cache.generation(cache_key)
+        if if_none_match:
+            # revalidation only needs the version columns
+            version = (await session.exec(select(*TASK_VERSION_COLUMNS).where(TaskDB.id == task_id))).first()
+            if version is None:
+                raise HTTPException(status_code=404, detail="Task not found")
+            etag = task_etag(version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, response)
+        task = (await session.exec(select_task_public().where(TaskDB.id == task_id))).first()
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        task_public = jsonable_encoder(to_task_public(task, priorities))
+        await read_cache.set(cache_key, task_public, generation=generation)
+    if includes:
+        return json_response((await add_task_includes(session, [task_public], includes))[0], response)
+    etag = task_etag(task_public)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+    response.headers[ETAG_HEADER] = etag
+    return json_response(task_public, response)
 
 
 @tasks_routers.post("/", response_model=TaskPublic)
@@ -78,77 +387,104 @@ async def post_task(
     task: TaskCreate,
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
 ) -> TaskPublic:
+    check_task_fields(task)
     # get data
     priority = await priority_desc(task.priority, session=session)
     # db
     current_time = datetime.now(timezone.utc)
-    task_db = TaskDB(
-        title=task.title,
-        description=task.description,
-        assigned_to=task.assigned_to,
-        created_at=current_time,
-        due_date=task.due_date,
-        completed=task.completed,
-        created_by=current_user.id,
-        updated_at=current_time,
-        priority_id=priority.id,
-    )
-    session.add(task_db)
-    session.commit()
-    session.refresh(task_db)
+    # insert ... returning gives back the stored row in the same round trip
+    task_db = (await session.exec(
+        insert(TaskDB)
+            .values(
+                title=task.title,
+                description=task.description,
+                assigned_to=task.assigned_to,
+                created_at=current_time,
+                due_date=task.due_date,
+                completed=task.completed,
+                created_by=current_user.id,
+                updated_at=current_time,
+                priority_id=priority.id if priority else None,
+            )
+            .returning(*TASK_PUBLIC_COLUMNS))).one()
+    await bump_task_counters(session, counter_deltas(added=[task_db]))
+    await session.commit()
     # return data from taskpublic
-    task_db_data = task_db.model_dump()
-    task_db_data["priority"] = task_db.priority.desc if task_db.priority else None
-    return TaskPublic.model_validate(task_db_data)
+    return to_task_public(task_db, priorities)
 
 
 @tasks_routers.delete("/{task_id}")
 async def delete_task(
-    task: Annotated[TaskDB, Depends(get_current_task)],
     task_id: int,
     session: SessionDep,
-    current_user: Annotated[UserPublic, Depends(get_current_active_user)]
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
 ):
-    task_db_data = task.model_dump()
-    task_db_data["priority"] = task.priority.desc if task.priority else None
-    session.delete(task)
     # remove comments of this task
-    taskcomments = session.exec(
+    taskcomments = await session.exec(
         delete(TaskCommentDB).where(TaskCommentDB.task_id == task_id))
+    task = (await session.exec(
+        delete(TaskDB).where(TaskDB.id == task_id).returning(*TASK_PUBLIC_COLUMNS))).first()
+    if not task:
+        # the session is rolled back when it is closed
+        raise HTTPException(status_code=404, detail="Task not found")
+    await bump_task_counters(session, counter_deltas(removed=[task]))
     # coment
-    session.commit()
+    await session.commit()
+    await read_cache.delete(task_cache_key(task_id), task_comments_cache_key(task_id))
     #
-    task_data = TaskPublic.model_validate(task_db_data).model_dump()
+    task_data = to_task_public(task, priorities).model_dump()
     return { "success": True, "task": task_data }
 
 
 @tasks_routers.put("/{task_id}", response_model=TaskPublic)
 async def update_task(
-    task_db: Annotated[TaskDB, Depends(get_current_task)],
+    task_id: int,
     task: TaskUpdate,
     session: SessionDep,
-    current_user: Annotated[UserPublic, Depends(get_current_active_user)]
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    priorities: TaskPrioritiesDep,
 ):
-    task_data = task.model_dump(exclude_unset=True)
+    check_task_fields(task)
+    # the primary key is never updated
+    task_data = task.model_dump(exclude_unset=True, exclude={"id"})
     task_data["updated_at"] = datetime.now(timezone.utc)
     if "priority" in task_data:
-        priority = await priority_desc(task_data["priority"], session=session)
-        task_data["priority_id"] = priority.id
-    
-    task_db.sqlmodel_update(task_data)
-    session.add(task_db)
-    session.commit()
-    session.refresh(task_db)
-
-    task_db_data = task_db.model_dump()
-    task_db_data["priority"] = task_db.priority.desc if task_db.priority else None
-    return TaskPublic.model_validate(task_db_data)
+        priority = await priority_desc(task_data.pop("priority"), session=session)
+        task_data["priority_id"] = priority.id if priority else None
+
+    # the statistics counters only change when a column of their key does
+    old_task = None
+    if TASK_COUNTER_FIELDS & task_data.keys():
+        old_task = (await session.exec(
+            select(*TASK_COUNTER_COLUMNS).where(TaskDB.id == task_id).with_for_update())).first()
+        if not old_task:
+            raise HTTPException(status_code=404, detail="Task not found")
+
+    task_db = (await session.exec(
+        update(TaskDB)
+            .where(TaskDB.id == task_id)
+            .values(**task_data)
+            .returning(*TASK_PUBLIC_COLUMNS))).first()
+    if not task_db:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if old_task:
+        await bump_task_counters(session, counter_deltas(removed=[old_task], added=[task_db]))
+    await session.commit()
+    await read_cache.delete(task_cache_key(task_id))
+
+    return to_task_public(task_db, priorities)
 
 # -------------------------------------------------------------------------------------------------
 # task comments
 # -------------------------------------------------------------------------------------------------
 
+# page size of GET /tasks/{task_id}/comments/, the default page is the one kept in the read cache
+COMMENTS_PAGE_SIZE = 50
+
+
 @tasks_routers.post("/{task_id}/comments", response_model=TaskCommentPublic)
 async def post_comments(
     task: Annotated[TaskDB, Depends(get_current_task)],
@@ -170,22 +506,87 @@ async def post_comments(
         }
     )
     session.add(taskcomment_db)
-    session.commit()
-    session.refresh(taskcomment_db)
+    # comment activity of the task, in the same transaction
+    await session.exec(
+        update(TaskDB)
+            .where(TaskDB.id == task.id)
+            .values(
+                comment_count=TaskDB.comment_count + 1,
+                last_comment_at=case(
+                    (TaskDB.last_comment_at > current_time, TaskDB.last_comment_at), else_=current_time)))
+    await session.commit()
+    await session.refresh(taskcomment_db)
+    await read_cache.delete(task_cache_key(task.id), task_comments_cache_key(task.id))
     return TaskCommentPublic.model_validate(taskcomment_db)
 
 
 @tasks_routers.get("/{task_id}/comments/", response_model=List[TaskCommentPublic])
+@rate_limit(cost=2)
 async def get_taskcomments(
-    task: Annotated[TaskDB, Depends(get_current_task)],
+    task_id: int,
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=100)] = COMMENTS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    taskcommments = session.exec(
-        select(TaskCommentDB)
-            .where(TaskCommentDB.task_id == task.id)
-            .order_by(TaskCommentDB.created_at))
-    return [ TaskCommentPublic.model_validate(item) for item in taskcommments ]
+    """
+    comments oldest first, keyset pagination on (created_at, id): the X-Next-Cursor
+    response header holds the cursor of the next page (absent on the last one).
+    fields=id,description,... selects only those columns and keys (no ETag).
+    """
+    field_names = parse_fields(fields, COMMENT_FIELDS)
+    after = decode_cursor(cursor, "comments", (datetime, int)) if cursor is not None else None
+    # only the default first page is kept in the read cache
+    cache_key = task_comments_cache_key(task_id) if after is None and limit == COMMENTS_PAGE_SIZE else None
+    page = await read_cache.get(cache_key) if cache_key else None
+    if page is None and field_names is not None:
+        task = await get_current_task(task_id, session)
+        # created_at and id are read for the cursor
+        columns = projection_columns(COMMENT_FIELDS, field_names, [TaskCommentDB.created_at, TaskCommentDB.id])
+        taskcomments = (await session.exec(task_comments_page(
+            select(*columns).where(TaskCommentDB.task_id == task.id), after, limit))).all()
+        if len(taskcomments) > limit:
+            taskcomments = taskcomments[:limit]
+            last = taskcomments[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor("comments", [last.created_at, last.id])
+        return json_response(project([ comment_document(c, field_names) for c in taskcomments ], field_names), response)
+    if page is None:
+        if if_none_match:
+            # revalidation only needs the (id, updated_at) of the comments
+            versions = await get_task_comments_versions(task_id, session, after, limit)
+            etag = task_comments_etag(task_id, versions[:limit], has_more=len(versions) > limit)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, response)
+        generation = await read_cache.generation(cache_key) if cache_key else None
+        # the task is only looked up on a miss
+        task = await get_current_task(task_id, session)
+        taskcomments = (await session.exec(task_comments_page(
+            select(TaskCommentDB).where(TaskCommentDB.task_id == task.id), after, limit))).all()
+        next_cursor = None
+        if len(taskcomments) > limit:
+            taskcomments = taskcomments[:limit]
+            last = taskcomments[-1]
+            next_cursor = encode_cursor("comments", [last.created_at, last.id])
+        page = {
+            "comments": jsonable_encoder([ TaskCommentPublic.model_validate(item) for item in taskcomments ]),
+            "next_cursor": next_cursor,
+        }
+        if cache_key:
+            await read_cache.set(cache_key, page, generation=generation)
+    if field_names is not None:
+        if page["next_cursor"]:
+            response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+        return json_response(project(page["comments"], field_names), response)
+    etag = task_comments_etag(task_id, page["comments"], has_more=page["next_cursor"] is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+    response.headers[ETAG_HEADER] = etag
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return json_response(page["comments"], response)
 
 
 @tasks_routers.get("/{task_id}/comments/{task_comment_id}", response_model=TaskCommentPublic)
@@ -204,8 +605,19 @@ async def delete_comment(
     current_user: Annotated[UserPublic, Depends(get_current_active_user)],
 ):
     taskcomment_data = task_comment.model_dump()
-    session.delete(task_comment)
-    session.commit()
+    await session.delete(task_comment)
+    await session.flush()
+    # comment activity of the task, in the same transaction
+    await session.exec(
+        update(TaskDB)
+            .where(TaskDB.id == task_comment.task_id)
+            .values(
+                comment_count=TaskDB.comment_count - 1,
+                last_comment_at=select(func.max(TaskCommentDB.created_at))
+                    .where(TaskCommentDB.task_id == task_comment.task_id)
+                    .scalar_subquery()))
+    await session.commit()
+    await read_cache.delete(task_cache_key(task_comment.task_id), task_comments_cache_key(task_comment.task_id))
     taskcomment_public = TaskCommentPublic.model_validate(taskcomment_data).model_dump()
     return { "success": True, "task": taskcomment_public }
 
@@ -218,52 +630,11 @@ async def update_comment(
     current_user: Annotated[UserPublic, Depends(get_current_active_user)],
 ):
     taskcomment_data = taskcomment_update.model_dump(exclude_unset=True)
+    # updated_at drives the etag of the comment list
+    taskcomment_data["updated_at"] = datetime.now(timezone.utc)
     task_comment.sqlmodel_update(taskcomment_data)
     session.add(task_comment)
-    session.commit()
-    session.refresh(task_comment)
+    await session.commit()
+    await session.refresh(task_comment)
+    await read_cache.delete(task_comments_cache_key(task_comment.task_id))
     return TaskCommentPublic.model_validate(task_comment)
-
-# -------------------------------------------------------------------------------------------------
-# statistic
-# -------------------------------------------------------------------------------------------------
-
-@tasks_routers.get("/statistics")
-async def get_statistics(
-    session: SessionDep,
-    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
-    created_by: Optional[int] = None,
-    assigned_to: Optional[int] = None,
-    completed : Optional[bool] = None,
-    created_at_start: Optional[datetime] = None,  # inclusive
-    created_at_end: Optional[datetime] = None,    # exclusive
-    due_date_at_start: Optional[datetime] = None,
-    due_date_at_end: Optional[datetime] = None,
-):
-    
-    def create_stats_query():
-        query = select(TaskDB)
-        if created_by is not None:
-            query = query.where(TaskDB.created_by == created_by)
-        if assigned_to is not None:
-            query = query.where(TaskDB.assigned_to == assigned_to)
-        if created_at_start is not None:
-            query = query.where(TaskDB.created_at >= created_at_start)
-        if created_at_end is not None:
-            query = query.where(TaskDB.created_at < created_at_end)
-        if due_date_at_start is not None:
-            query = query.where(TaskDB.due_date >= due_date_at_start)
-        if due_date_at_end is not None:
-            query = query.where(TaskDB.due_date < due_date_at_end)
-        return query
-
-    num_task_completed = all(session.exec(create_stats_query().where(TaskDB.completed == True)).all())
-    num_task_no_completed = all(session.exec(create_stats_query().where(TaskDB.completed == False)).all())
-    num_task_total = num_task_completed + num_task_no_completed
-    return { 
-        "detail": { 
-            "completed": num_task_completed,
-            "no_completed": num_task_no_completed,
-            "total": num_task_total
-        },
-    }
@@ -7,9 +7,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
 
-from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES
-from app.core.rate_limiter import get_rate_limiter
+from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES, RATE_LIMIT_LOGIN_MINUTE
+from app.core.rate_limiter import get_rate_limiter, rate_limit
 from app.core.security import create_access_token
+from app.db.database import SessionDep
 from app.db.users import authenticate_user
 from app.models.token import Token
 
@@ -18,10 +19,12 @@ token_routes = APIRouter(prefix="/token", tags=["token"], dependencies=[Depends(
 
 
 @token_routes.post("/")
+@rate_limit(cost=10, per_minute=RATE_LIMIT_LOGIN_MINUTE)
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    session: SessionDep,
 ) -> Token:
-    user = await authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
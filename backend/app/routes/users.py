@@ -1,15 +1,21 @@
 from typing import Annotated, List
 from pydantic import ValidationError
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Depends, Response
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
 
 
+from app.core.cache import read_cache
+from app.core.config import MULTI_GET_MAX_IDS
+from app.core.etag import ETAG_HEADER, etag_matches, not_modified
 from app.db.database import SessionDep
-from app.db.users import get_current_active_admin_user, get_current_active_user
-from app.models.user import UserCreate, UserDB, UserPublic, UserUpdate
-from app.core.rate_limiter import get_rate_limiter
+from app.db.users import get_current_active_admin_user, get_current_active_user, invalidate_principal, user_cache_key
+from app.db.users import user_etag
+from app.db.multiget import check_ids, get_users_by_ids, parse_ids
+from app.models.user import UserCreate, UserDB, UserMultiGetResult, UserPublic, UserUpdate
+from app.core.rate_limiter import get_rate_limiter, rate_limit
 from app.core.security import get_password_hash
 
 
@@ -20,24 +26,26 @@ users_routers = APIRouter(
 
 
 @users_routers.get("/", response_model=List[UserPublic])
+@rate_limit(cost=2)
 async def read_users(
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_admin_user)],
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 100,
 ):
-    users = session.exec(select(UserDB).offset(offset).limit(limit)).all()
+    users = (await session.exec(select(UserDB).offset(offset).limit(limit))).all()
     return users
 
 
 @users_routers.post("/", response_model=UserPublic)
+@rate_limit(cost=10)
 async def post_user(
     user: UserCreate,
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_admin_user)],
 ):
     try:
-        hashed_pw = get_password_hash(user.password)
+        hashed_pw = await get_password_hash(user.password)
         db_user = UserDB.model_validate(user, update={"hashed_password": hashed_pw})
         # db_user = UserDB(
         #     username=user.username,
@@ -49,46 +57,87 @@ async def post_user(
         #     hashed_password=hashed_pw,
         # )
         session.add(db_user)
-        session.commit()
-        session.refresh(db_user)
+        await session.commit()
+        await session.refresh(db_user)
     except ValidationError:
         raise HTTPException(status_code=404, detail="User invalid")
     except IntegrityError:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=400, detail="Username, email or phone already exists")
     return UserPublic.model_validate(db_user)
 
 
+# declared before /{user_id}, otherwise "by-ids" is matched as a user id
+@users_routers.get("/by-ids", response_model=UserMultiGetResult)
+@rate_limit(cost=2)
+async def read_users_by_id_list(
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    ids: Annotated[str, Query(description="comma separated user ids")],
+):
+    """
+    users in the order of ids, through the read cache of GET /users/{user_id}
+    """
+    return await get_users_by_ids(session, parse_ids(ids))
+
+
+@users_routers.post("/by-ids", response_model=UserMultiGetResult)
+@rate_limit(cost=2)
+async def post_users_by_id_list(
+    ids: Annotated[List[int], Body(max_length=MULTI_GET_MAX_IDS)],
+    session: SessionDep,
+    current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+):
+    check_ids(ids)
+    return await get_users_by_ids(session, ids)
+
+
 @users_routers.get("/{user_id}", response_model=UserPublic)
 async def read_user(
     user_id: int,
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_user)],
+    response: Response,
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    user = session.get(UserDB, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User no found")
-    return user
+    cache_key = user_cache_key(user_id)
+    user_public = await read_cache.get(cache_key)
+    if user_public is None:
+        generation = await read_cache.generation(cache_key)
+        user = await session.get(UserDB, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User no found")
+        user_public = jsonable_encoder(UserPublic.model_validate(user))
+        await read_cache.set(cache_key, user_public, generation=generation)
+    etag = user_etag(user_public)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response)
+    response.headers[ETAG_HEADER] = etag
+    return user_public
 
 
 @users_routers.put("/{user_id}", response_model=UserPublic)
+@rate_limit(cost=10)
 async def update_user(
     user_id: int,
     useru: UserUpdate,
     session: SessionDep,
     current_user: Annotated[UserPublic, Depends(get_current_active_admin_user)],
 ):
-    user_db = session.get(UserDB, user_id)
+    user_db = await session.get(UserDB, user_id)
     if not user_db:
         raise HTTPException(status_code=404, detail="User not found")
+    username = user_db.username
     user_data = useru.model_dump(exclude_unset=True)
     # Hash password if provided
     if "password" in user_data:
-        user_data["hashed_password"] = get_password_hash(user_data.pop("password"))
+        user_data["hashed_password"] = await get_password_hash(user_data.pop("password"))
     user_db.sqlmodel_update(user_data)
     session.add(user_db)
-    session.commit()
-    session.refresh(user_db)
+    await session.commit()
+    await session.refresh(user_db)
+    await invalidate_principal(username)
+    await read_cache.delete(user_cache_key(user_id))
     return user_db
 
 
@@ -100,6 +149,7 @@ async def get_me(
 
 
 @users_routers.patch("/me/", response_model=UserPublic)
+@rate_limit(cost=10)
 async def update_me(
     useru: UserUpdate,
     session: SessionDep,
@@ -108,17 +158,19 @@ async def update_me(
     if useru.id != current_user.id:
         raise HTTPException(status_code=401, detail="Invalid change this user")
     user_id = current_user.id
-    user_db = session.get(UserDB, user_id)
+    user_db = await session.get(UserDB, user_id)
     if not user_db:
         raise HTTPException(status_code=404, detail="User not found")
     # Hash password if provided
     user_data = useru.model_dump(exclude_unset=True)
     if "password" in user_data:
-        user_data["hashed_password"] = get_password_hash(user_data.pop("password"))
+        user_data["hashed_password"] = await get_password_hash(user_data.pop("password"))
     user_db.sqlmodel_update(user_data)
     session.add(user_db)
-    session.commit()
-    session.refresh(user_db)
+    await session.commit()
+    await session.refresh(user_db)
+    await invalidate_principal(current_user.username)
+    await read_cache.delete(user_cache_key(user_id))
     return user_db
 
 
@@ -0,0 +1,81 @@
+"""
+production entry point
+
+    python -m app.server [--host 0.0.0.0] [--port 8000] [--workers N]
+    python -m app.server --dev        # one process, reloads on changes
+
+behind a reverse proxy or load balancer set FORWARDED_ALLOW_IPS (or
+--forwarded-allow-ips) to its addresses, otherwise every client has the ip of
+the proxy and anonymous callers share one rate limit bucket
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+import uvicorn
+
+from app.core.config import DB_MAX_CONNECTIONS, SERVER_GRACEFUL_SHUTDOWN_SECONDS, SERVER_HOST, SERVER_PORT
+from app.core.config import SERVER_FORWARDED_ALLOW_IPS, SERVER_WORKERS
+
+
+def available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def cpu_count() -> int:
+    # cpus this process may run on (containers with a cpu set)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pool_sizing(max_connections: int, workers: int) -> tuple[int, int]:
+    """
+    (pool_size, max_overflow) of each worker so that all of them together never
+    open more than max_connections, a third of the share is overflow for bursts
+    """
+    per_worker = max_connections // workers
+    if per_worker < 1:
+        raise ValueError(f"DB_MAX_CONNECTIONS={max_connections} is less than one connection per worker ({workers})")
+    overflow = per_worker // 3
+    return per_worker - overflow, overflow
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.server")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS or cpu_count(),
+                        help="worker processes (default: WEB_CONCURRENCY or the cpu count)")
+    parser.add_argument("--dev", action="store_true", help="single process with --reload, for development")
+    parser.add_argument("--access-log", action="store_true", help="log every request (always on with --dev)")
+    parser.add_argument("--forwarded-allow-ips", default=SERVER_FORWARDED_ALLOW_IPS,
+                        help="trusted proxies whose X-Forwarded-For sets the client ip (default: FORWARDED_ALLOW_IPS)")
+    args = parser.parse_args(argv)
+
+    workers = 1 if args.dev else max(1, args.workers)
+    if DB_MAX_CONNECTIONS:
+        # read by app.core.config in every worker process
+        pool_size, max_overflow = pool_sizing(DB_MAX_CONNECTIONS, workers)
+        os.environ["DB_POOL_SIZE"] = str(pool_size)
+        os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=None if args.dev else workers,
+        reload=args.dev,
+        loop="uvloop" if available("uvloop") else "asyncio",
+        http="httptools" if available("httptools") else "h11",
+        timeout_graceful_shutdown=SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+        access_log=args.dev or args.access_log,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""
+microbenchmark of the token verification done by get_current_user
+
+    python -m benchmarks.bench_auth
+"""
+import asyncio
+import os
+import timeit
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+
+import jwt
+
+from app.core.config import HASH_ALGORITHM, SECRET_KEY
+from app.core.security import create_access_token, decode_access_token
+
+
+NUMBER = 20000
+
+
+def main():
+    token = create_access_token(data={"sub": "benchmark"})
+    loop = asyncio.new_event_loop()
+
+    def uncached():
+        for _ in range(NUMBER):
+            jwt.decode(token, SECRET_KEY, algorithms=[HASH_ALGORITHM])
+
+    async def decode_many():
+        for _ in range(NUMBER):
+            await decode_access_token(token)
+
+    def cached():
+        loop.run_until_complete(decode_many())
+
+    loop.run_until_complete(decode_access_token(token))  # warm the cache
+    for name, func in (("jwt.decode", uncached), ("decode_access_token (cached)", cached)):
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:<32} {seconds / NUMBER * 1e6:8.2f} us/request")
+    loop.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+serialization of a page of tasks: the response_model path (TaskPublic objects,
+validated again by the response model, json.dumps) against plain dicts encoded
+once with orjson (json_response)
+
+    python -m benchmarks.bench_serialization
+"""
+import json
+import os
+import timeit
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.core.responses import json_bytes
+from app.db.dimensions import DimensionTable
+from app.db.tasks import task_public_document, to_task_public
+from app.models.task import TaskPriority, TaskPublic
+
+
+def make_rows(count: int) -> list:
+    now = datetime(2026, 1, 1, 12, 0, 0, 123456)
+    return [
+        SimpleNamespace(
+            id=i, title=f"Task {i}", description="benchmark task " * 4, assigned_to=2, created_by=1,
+            created_at=now, due_date=now + timedelta(days=i % 30), completed=i % 3 == 0,
+            updated_at=now, priority_id=i % 3, comment_count=i % 5, last_comment_at=None,
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    priorities = DimensionTable(TaskPriority)
+    priorities.by_id = {0: "Low", 1: "Medium", 2: "High"}
+    response_model = TypeAdapter(List[TaskPublic])
+
+    for count in (20, 1000):
+        rows = make_rows(count)
+
+        def response_model_path():
+            # what FastAPI does with a list of TaskPublic and response_model=List[TaskPublic]
+            # (fastapi.routing.serialize_response then JSONResponse.render)
+            content = response_model.validate_python([to_task_public(row, priorities) for row in rows], from_attributes=True)
+            json.dumps(response_model.dump_python(content, mode="json"),
+                       ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+        def orjson_path():
+            json_bytes([task_public_document(row, priorities) for row in rows])
+
+        assert json.loads(json_bytes([task_public_document(row, priorities) for row in rows])) == \
+            jsonable_encoder([to_task_public(row, priorities) for row in rows])
+        number = max(1, 20000 // count)
+        timings = {}
+        for name, func in (("response_model + json", response_model_path), ("dicts + orjson", orjson_path)):
+            timings[name] = min(timeit.repeat(func, number=number, repeat=5)) / number
+            print(f"{count:>5} rows  {name:<24} {timings[name] * 1e6:10.1f} us/page")
+        print(f"{count:>5} rows  speedup {timings['response_model + json'] / timings['dicts + orjson']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
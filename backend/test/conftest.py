@@ -0,0 +1,11 @@
+import uuid
+
+import pytest
+
+from app.core import rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiter(monkeypatch):
+    # every test starts with the whole budget, the suite sends hundreds of requests per minute
+    monkeypatch.setattr(rate_limiter, "rate_limiter", rate_limiter.RateLimiter(namespace=f"ratelimit-test:{uuid.uuid4().hex}"))
@@ -0,0 +1,214 @@
+import asyncio
+import time
+
+import pytest
+
+from redis.exceptions import ConnectionError
+
+from app.core import cache as cache_module
+from app.core import redis as redis_module
+from app.core.cache import CacheInvalidator, ReadThroughCache, TTLCache
+from app.core.config import REDIS_SOCKET_TIMEOUT_SECONDS
+from app.db.dimensions import DimensionTable
+from app.models.task import TaskPriority
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_entries_expire():
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_ignores_values_read_before_invalidation():
+    cache = TTLCache(maxsize=10, ttl=60)
+    generation = cache.generation
+    cache.pop("a")
+    cache.set("a", "stale", generation=generation)
+    assert cache.get("a") is None
+
+
+class FakePubSub:
+    def __init__(self, fail_subscribe=False, messages=(), fail_after_messages=False):
+        self.fail_subscribe = fail_subscribe
+        self.messages = messages
+        self.fail_after_messages = fail_after_messages
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    async def subscribe(self, channel):
+        if self.fail_subscribe:
+            raise ConnectionError("redis is down")
+
+    async def listen(self):
+        for data in self.messages:
+            yield {"type": "message", "data": data}
+        if self.fail_after_messages:
+            raise ConnectionError("connection lost")
+        await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_invalidation_listener_releases_its_connections(monkeypatch):
+    pubsubs = [
+        FakePubSub(fail_subscribe=True),
+        FakePubSub(messages=["local:a"], fail_after_messages=True),
+        FakePubSub(),
+    ]
+    opened = []
+
+    class FakeRedis:
+        def pubsub(self):
+            opened.append(pubsubs[len(opened)])
+            return opened[-1]
+
+    monkeypatch.setattr(cache_module, "get_pubsub_redis", lambda: FakeRedis())
+    invalidator = CacheInvalidator()
+    invalidator.retry_seconds = 0
+    local = TTLCache(maxsize=10, ttl=60)
+    invalidator.register("local", local)
+    local.set("a", 1)
+    cleared = []
+    invalidator.register("counted", type("Counted", (), {
+        "pop": lambda self, key: None, "clear": lambda self: cleared.append(True)})())
+
+    listener = asyncio.create_task(invalidator.listen())
+    while len(opened) < 3:
+        await asyncio.sleep(0.01)
+    # 1. Un fallo al suscribirse no borra nada, la perdida de la suscripcion si
+    assert local.get("a") is None
+    assert len(cleared) == 1
+    listener.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await listener
+    # 2. Todas las conexiones pubsub se cierran
+    assert all(pubsub.closed for pubsub in pubsubs)
+
+
+def test_subscriptions_do_not_use_the_socket_timeout(monkeypatch):
+    monkeypatch.setattr(redis_module, "REDIS_HOST", "redis")
+    monkeypatch.setattr(redis_module, "REDIS_URI", "redis://redis:6379/0")
+    monkeypatch.setattr(redis_module, "redis_client", None)
+    monkeypatch.setattr(redis_module, "pubsub_client", None)
+    # una suscripcion sin mensajes no debe expirar como una lectura lenta
+    assert redis_module.get_redis().connection_pool.connection_kwargs["socket_timeout"] == REDIS_SOCKET_TIMEOUT_SECONDS
+    assert redis_module.get_pubsub_redis().connection_pool.connection_kwargs.get("socket_timeout") is None
+
+
+class FakeCacheRedis:
+    """
+    the redis commands of ReadThroughCache on a dict, pipelined commands run at once
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+
+    def expire(self, key, seconds):
+        pass
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline:
+            async def __aenter__(self):
+                return redis
+
+            async def __aexit__(self, *exc):
+                pass
+        return Pipeline()
+
+    async def execute(self):
+        pass
+
+    def register_script(self, script):
+        async def guarded_set(keys, args, client=None):
+            if int(self.data.get(keys[1], 0)) == args[2]:
+                self.data[keys[0]] = args[0]
+        return guarded_set
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["local", "redis"])
+async def test_read_cache_does_not_store_values_read_before_a_delete(monkeypatch, backend):
+    redis = FakeCacheRedis() if backend == "redis" else None
+    monkeypatch.setattr(cache_module, "get_redis", lambda: redis)
+    cache = ReadThroughCache()
+
+    # 1. Un lector falla en cache y lee la generacion antes de ir a la base de datos
+    assert await cache.get("task:1") is None
+    generation = await cache.generation("task:1")
+    generations = await cache.generations(["task:2", "task:3"])
+    # 2. Un escritor actualiza la tarea e invalida mientras tanto
+    await cache.delete("task:1", "task:2")
+    # 3. El valor viejo del lector no se guarda, el de otra clave si
+    await cache.set("task:1", {"title": "stale"}, generation=generation)
+    await cache.set_many({"task:2": {"title": "stale"}, "task:3": {"title": "fresh"}}, generations=generations)
+    assert await cache.get("task:1") is None
+    if backend == "redis":
+        assert await cache.get_many(["task:2", "task:3"]) == [None, {"title": "fresh"}]
+
+    # 4. El siguiente lector guarda el valor nuevo
+    generation = await cache.generation("task:1")
+    await cache.set("task:1", {"title": "fresh"}, generation=generation)
+    assert await cache.get("task:1") == {"title": "fresh"}
+
+
+@pytest.mark.asyncio
+async def test_unknown_dimension_values_reload_the_table_at_most_once_per_interval():
+    class CountingSession:
+        queries = 0
+
+        async def exec(self, statement):
+            self.queries += 1
+
+            class Rows:
+                def all(self):
+                    return [TaskPriority(id=1, desc="Low")]
+            return Rows()
+
+    session = CountingSession()
+    priorities = DimensionTable(TaskPriority, reload_seconds=60)
+    await priorities.ensure_loaded(session)
+    # 1. Un valor desconocido repetido no vuelve a consultar la tabla
+    for _ in range(5):
+        if priorities.id("Unknown") is None:
+            await priorities.reload_missing(session)
+    assert session.queries == 1
+
+    # 2. Pasado el intervalo se recarga una vez
+    priorities.loaded_at -= 60
+    assert await priorities.reload_missing(session)
+    assert not await priorities.reload_missing(session)
+    assert session.queries == 2
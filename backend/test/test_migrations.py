@@ -0,0 +1,67 @@
+import pytest
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import func, select, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db import database
+from app.db.database import bootstrap, db_config, engine
+from app.db.migrations import migrate, MIGRATIONS, pending_migrations
+from app.models.task import TaskPriority
+
+
+@pytest.mark.asyncio
+async def test_migrations_and_bootstrap_are_idempotent(monkeypatch):
+    hashed = []
+
+    async def get_password_hash(password):
+        hashed.append(password)
+        return "hash"
+
+    monkeypatch.setattr(database, "get_password_hash", get_password_hash)
+    try:
+        # 1. Base de datos ya migrada: nada pendiente
+        assert await migrate(engine) == []
+        async with engine.connect() as conn:
+            assert await pending_migrations(conn) == []
+        assert [m.version for m in MIGRATIONS] == sorted({m.version for m in MIGRATIONS})
+
+        # 2. El bootstrap no duplica filas ni vuelve a hashear la contrasena del superusuario
+        await bootstrap()
+        await bootstrap()
+        assert hashed == []
+        async with AsyncSession(engine, **db_config) as session:
+            assert (await session.exec(select(func.count()).select_from(TaskPriority))).one() == 3
+    finally:
+        await engine.dispose()
+
+
+def model_schema(sync_conn) -> dict:
+    inspector = inspect(sync_conn)
+    return {
+        table: (
+            {column["name"] for column in inspector.get_columns(table)},
+            {index["name"] for index in inspector.get_indexes(table)},
+        )
+        for table in SQLModel.metadata.tables
+    }
+
+
+@pytest.mark.asyncio
+async def test_migrations_build_the_schema_of_the_models_on_a_fresh_database(tmp_path):
+    fresh = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/fresh.db")
+    try:
+        # 1. Base de datos vacia: se aplican todas las migraciones, una sola vez
+        assert [m.version for m in await migrate(fresh)] == [m.version for m in MIGRATIONS]
+        assert await migrate(fresh) == []
+
+        # 2. El resultado tiene las columnas e indices de los modelos actuales
+        async with fresh.connect() as conn:
+            schema = await conn.run_sync(model_schema)
+        for table in SQLModel.metadata.sorted_tables:
+            columns, indexes = schema[table.name]
+            assert columns == set(table.columns.keys()), table.name
+            assert {index.name for index in table.indexes} <= indexes, table.name
+    finally:
+        await fresh.dispose()
@@ -0,0 +1,257 @@
+import asyncio
+
+import pytest
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError
+from starlette.requests import Request
+
+from app.core import rate_limiter as rate_limiter_module
+from app.core.config import RATE_LIMIT_EXPENSIVE_MINUTE, RATE_LIMIT_LOGIN_MINUTE, REQUEST_RATE_LIMIT_MINUTE
+from app.core.config import SUPERUSER_PASSWORD, SUPERUSER_USERNAME
+from app.core.rate_limiter import client_identity, get_rate_limiter, RateLimiter, sliding_window
+from app.core.security import create_access_token
+from app.main import app
+
+
+def test_sliding_window_weighs_the_previous_window():
+    counts = {}
+    # 1. Ventana llena
+    assert sliding_window(counts, 10, 1000, 5_500, cost=1, requested=10) == (10, 0, 0)
+    granted, remaining, retry_ms = sliding_window(counts, 10, 1000, 5_900, cost=1, requested=1)
+    assert (granted, remaining) == (0, 0)
+    assert retry_ms == 100
+    # 2. 70% de la ventana siguiente: solo cuenta el 30% de la anterior
+    assert sliding_window(counts, 10, 1000, 6_700, cost=1, requested=10) == (7, 0, 0)
+
+
+class WindowRedis:
+    """
+    runs SLIDING_WINDOW_LUA with its python mirror, counting the round trips.
+    every call yields to the event loop like a real round trip
+    """
+
+    def __init__(self):
+        self.windows = {}
+        self.calls = 0
+
+    def register_script(self, script):
+        async def run(keys, args):
+            await asyncio.sleep(0)
+            self.calls += 1
+            name, index = keys[0].rsplit(":", 1)
+            limit, window_ms, elapsed, cost, requested, refund_current, refund_previous = args
+            counts = self.windows.setdefault(name, {})
+            return sliding_window(counts, limit, window_ms, int(index) * window_ms + elapsed, cost, requested,
+                                  refund_current, refund_previous)
+        return run
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spends_local_leases_and_denies_over_the_limit(monkeypatch):
+    redis = WindowRedis()
+    monkeypatch.setattr(rate_limiter_module, "get_redis", lambda: redis)
+    limiter = RateLimiter(batch=5)
+    # 1. Solo se consulta la ventana una vez por lote
+    decisions = [await limiter.hit("user:alice", 100, 60) for _ in range(5)]
+    assert all(d.allowed for d in decisions)
+    assert [d.remaining for d in decisions] == [99, 98, 97, 96, 95]
+    assert redis.calls == 1
+
+    # 2. Limite agotado: denegado con Retry-After, otros clientes no se ven afectados
+    for _ in range(95):
+        assert (await limiter.hit("user:alice", 100, 60)).allowed
+    denied = await limiter.hit("user:alice", 100, 60)
+    assert not denied.allowed
+    assert 0 < denied.retry_after <= 60
+    assert (await limiter.hit("ip:10.0.0.1", 100, 60)).allowed
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_gives_back_the_tokens_of_expired_leases(monkeypatch):
+    # ventana alineada: 45 rafagas caben en el mismo minuto
+    clock = Clock(60 * 20_000_000)
+    redis = WindowRedis()
+    monkeypatch.setattr(rate_limiter_module, "time", clock)
+    monkeypatch.setattr(rate_limiter_module, "get_redis", lambda: redis)
+    limiter = RateLimiter(batch=10, lease_seconds=1)
+
+    # 1. Rafagas de 11 peticiones separadas algo mas que la duracion del lote:
+    #    cada rafaga deja 9 fichas sin gastar que se devuelven con el siguiente lote
+    for burst in range(45):
+        decisions = [await limiter.hit("user:alice", 600, 60) for _ in range(11)]
+        assert all(d.allowed for d in decisions), burst
+        clock.now += 1.3
+    assert decisions[-1].remaining == 600 - 45 * 11
+
+    # 2. En la ventana solo cuentan las fichas gastadas
+    await limiter.hit("user:alice", 600, 60)
+    assert sum(redis.windows["ratelimit:{user:alice}"].values()) == 45 * 11 + 10
+
+
+@pytest.mark.asyncio
+async def test_concurrent_hits_take_the_lease_tokens_once(monkeypatch):
+    clock = Clock(60 * 20_000_000)
+    redis = WindowRedis()
+    monkeypatch.setattr(rate_limiter_module, "time", clock)
+    monkeypatch.setattr(rate_limiter_module, "get_redis", lambda: redis)
+    limiter = RateLimiter(batch=10, lease_seconds=1)
+
+    def counted(key):
+        return sum(redis.windows[f"ratelimit:{{{key}}}"].values())
+
+    # 1. Lote caducado con 9 fichas: se devuelven una sola vez
+    assert (await limiter.hit("user:alice", 600, 60)).allowed
+    clock.now += 1.1
+    decisions = await asyncio.gather(*[limiter.hit("user:alice", 600, 60) for _ in range(5)])
+    assert all(d.allowed for d in decisions)
+    assert counted("user:alice") == 6 + limiter.leases.get("user:alice").tokens
+
+    # 2. Lote vivo con 1 ficha y coste 3: la ficha no se reparte entre varias peticiones
+    for _ in range(3):
+        assert (await limiter.hit("user:bob", 600, 60, cost=3)).allowed
+    assert limiter.leases.get("user:bob").tokens == 1
+    decisions = await asyncio.gather(*[limiter.hit("user:bob", 600, 60, cost=3) for _ in range(4)])
+    assert all(d.allowed for d in decisions)
+    assert counted("user:bob") == 7 * 3 + limiter.leases.get("user:bob").tokens
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_does_not_batch_the_in_process_window():
+    limiter = RateLimiter(batch=5)
+    assert (await limiter.hit("user:alice", 100, 60)).remaining == 99
+    assert sum(limiter.windows.get("user:alice").values()) == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_fails_open_without_redis(monkeypatch):
+    calls = []
+
+    class BrokenRedis:
+        def register_script(self, script):
+            async def run(keys, args):
+                calls.append(keys)
+                raise ConnectionError("redis is down")
+            return run
+
+    monkeypatch.setattr(rate_limiter_module, "get_redis", lambda: BrokenRedis())
+    limiter = RateLimiter()
+    assert (await limiter.hit("user:alice", 1, 60)).allowed
+    assert (await limiter.hit("user:alice", 1, 60)).allowed
+    # redis no se vuelve a consultar hasta RATE_LIMIT_REDIS_RETRY_SECONDS
+    assert len(calls) == 1
+    assert limiter.errors == 1
+
+
+@pytest.mark.asyncio
+async def test_client_identity_is_the_user_or_the_ip():
+    def request(headers):
+        return Request({
+            "type": "http",
+            "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+            "client": ("10.0.0.7", 1234),
+        })
+
+    token = create_access_token({"sub": "alice"})
+    assert await client_identity(request({"Authorization": f"Bearer {token}"})) == "user:alice"
+    assert await client_identity(request({"Authorization": "Bearer not-a-token"})) == "ip:10.0.0.7"
+    assert await client_identity(request({})) == "ip:10.0.0.7"
+
+
+@pytest.mark.asyncio
+async def test_routes_are_charged_their_cost_and_quota(monkeypatch):
+    monkeypatch.delitem(app.dependency_overrides, get_rate_limiter, raising=False)
+    client = TestClient(app=app)
+
+    # 1. El login tiene su propia cuota
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    assert token_response.headers["X-RateLimit-Limit"] == str(RATE_LIMIT_LOGIN_MINUTE)
+    assert token_response.headers["X-RateLimit-Remaining"] == str(RATE_LIMIT_LOGIN_MINUTE - 1)
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 2. Lectura barata: 1 del presupuesto del usuario
+    response = client.get("/users/me/", headers=headers)
+    assert response.headers["X-RateLimit-Limit"] == str(REQUEST_RATE_LIMIT_MINUTE)
+    assert response.headers["X-RateLimit-Remaining"] == str(REQUEST_RATE_LIMIT_MINUTE - 1)
+
+    # 3. Estadisticas: cuota propia, agotada devuelve 429 con Retry-After
+    for i in range(RATE_LIMIT_EXPENSIVE_MINUTE):
+        response = client.get("/tasks/statistics", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Remaining"] == str(RATE_LIMIT_EXPENSIVE_MINUTE - 1 - i)
+    response = client.get("/tasks/statistics", headers=headers)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.headers["X-RateLimit-Remaining"] == "0"
+
+    # 4. El resto de rutas sigue disponible, con el coste ya descontado
+    response = client.get("/users/me/", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["X-RateLimit-Remaining"] == str(REQUEST_RATE_LIMIT_MINUTE - 2 - 10 * RATE_LIMIT_EXPENSIVE_MINUTE)
+
+
+@pytest.mark.asyncio
+async def test_requests_denied_by_the_budget_do_not_spend_the_route_quota(monkeypatch):
+    monkeypatch.delitem(app.dependency_overrides, get_rate_limiter, raising=False)
+    monkeypatch.setattr(rate_limiter_module, "REQUEST_RATE_LIMIT_MINUTE", 25)
+    client = TestClient(app=app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': SUPERUSER_USERNAME})}"}
+
+    # 1. Con un presupuesto de 25 solo caben 2 estadisticas (coste 10): la cabecera
+    #    cuenta peticiones de la ruta, no fichas del presupuesto
+    response = client.get("/tasks/statistics", headers=headers)
+    assert response.headers["X-RateLimit-Limit"] == "25"
+    assert response.headers["X-RateLimit-Remaining"] == "1"
+    response = client.get("/tasks/statistics", headers=headers)
+    assert response.headers["X-RateLimit-Remaining"] == "0"
+
+    # 2. Denegada por el presupuesto, la cuota de la ruta no se gasta
+    response = client.get("/tasks/statistics", headers=headers)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    route = await rate_limiter_module.rate_limiter.hit(f"user:{SUPERUSER_USERNAME}:get_statistics", RATE_LIMIT_EXPENSIVE_MINUTE, 60)
+    assert route.remaining == RATE_LIMIT_EXPENSIVE_MINUTE - 3
+
+
+@pytest.mark.asyncio
+async def test_not_modified_and_streamed_responses_send_the_rate_limit_headers(monkeypatch):
+    monkeypatch.delitem(app.dependency_overrides, get_rate_limiter, raising=False)
+    client = TestClient(app=app)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': SUPERUSER_USERNAME})}"}
+    user_id = client.get("/users/me/", headers=headers).json()["id"]
+
+    # 1. Un 304 por If-None-Match lleva las cabeceras del limite junto al ETag
+    response = client.get(f"/users/{user_id}", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+    response = client.get(f"/users/{user_id}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert response.headers["X-RateLimit-Limit"] == str(REQUEST_RATE_LIMIT_MINUTE)
+    assert response.headers["X-RateLimit-Remaining"] == str(REQUEST_RATE_LIMIT_MINUTE - 3)
+
+    # 2. La exportacion en streaming tambien (coste 20: manda el presupuesto)
+    response = client.get("/tasks/export", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Disposition"] == 'attachment; filename="tasks.ndjson"'
+    assert response.headers["X-RateLimit-Limit"] == str(REQUEST_RATE_LIMIT_MINUTE)
+    assert response.headers["X-RateLimit-Remaining"] == str((REQUEST_RATE_LIMIT_MINUTE - 3 - 20) // 20)
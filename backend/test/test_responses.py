@@ -0,0 +1,34 @@
+import json
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+from app.core.responses import json_response
+from app.db.dimensions import DimensionTable
+from app.db.tasks import task_public_document, to_task_public
+from app.models.task import TaskPriority
+
+
+def test_json_response_matches_the_response_model_output():
+    priorities = DimensionTable(TaskPriority)
+    priorities.by_id = {2: "High"}
+    row = SimpleNamespace(
+        id=7, title="Título", description=None, assigned_to=None, created_by=1,
+        created_at=datetime(2026, 1, 2, 3, 4, 5, 120), due_date=datetime(2026, 1, 3),
+        completed=False, updated_at=datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        priority_id=2, comment_count=0, last_comment_at=None,
+    )
+    # 1. Mismo json que TaskPublic, en el mismo orden de claves
+    response = Response()
+    response.headers["X-Next-Cursor"] = "abc"
+    sent = json_response([task_public_document(row, priorities)], response)
+    expected = jsonable_encoder([to_task_public(row, priorities)])
+    assert list(json.loads(sent.body)[0].items()) == list(expected[0].items())
+
+    # 2. Conserva las cabeceras ya fijadas en la respuesta
+    assert sent.headers["X-Next-Cursor"] == "abc"
+    assert sent.headers["content-type"] == "application/json"
+    assert int(sent.headers["content-length"]) == len(sent.body)
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import SUPERUSER_PASSWORD, SUPERUSER_USERNAME
+from app.db.pool import engine_pool_options, InstrumentedQueuePool, pool_stats
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_superuser_can_read_pool_stats():
+    client = TestClient(app=app)
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    access_token = token_response.json()["access_token"]
+
+    response = client.get(
+        "/root/stats",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    pool = response.json()["pool"]
+    assert pool["checkouts"] >= 1
+    assert pool["timeouts"] >= 0
+    assert "wait_time_avg_ms" in pool
+    assert "checked_out" in pool
+    cache = response.json()["cache"]
+    assert cache["backend"] in ("redis", "local")
+    assert "resources" in cache
+    assert "steps_ms" in response.json()["startup"]
+
+
+@pytest.mark.asyncio
+async def test_pool_counts_opening_a_connection_apart_from_waiting(tmp_path):
+    # 1. Solo los dialectos con pool usan el pool instrumentado
+    assert engine_pool_options("sqlite+aiosqlite://", pool_size=5) == {}
+    assert engine_pool_options(f"sqlite+aiosqlite:///{tmp_path}/x.db", pool_size=5) == {
+        "poolclass": InstrumentedQueuePool, "pool_size": 5}
+
+    # 2. Abrir una conexion lenta es tiempo de conexion, no de espera
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/x.db", poolclass=InstrumentedQueuePool)
+    event.listen(engine.sync_engine, "connect", lambda dbapi_connection, record: time.sleep(0.05))
+    connects, wait_time = pool_stats.connects, pool_stats.wait_time_total
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    finally:
+        await engine.dispose()
+    assert pool_stats.connects == connects + 1
+    assert pool_stats.connect_time_max >= 0.05
+    assert pool_stats.wait_time_total - wait_time < 0.05
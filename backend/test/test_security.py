@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+import jwt
+import pytest
+
+from passlib.hash import bcrypt
+
+from app.core.security import create_access_token, decode_access_token, revoke_access_token
+from app.core.config import TOKEN_CACHE_SIZE
+from app.core.security import get_password_hash, RevokedTokens, token_cache, token_digest
+from app.core.security import verify_and_update_password, verify_password
+
+
+@pytest.mark.asyncio
+async def test_new_hashes_use_argon2():
+    hashed = await get_password_hash("secretpassword")
+    assert hashed.startswith("$argon2")
+    assert await verify_password("secretpassword", hashed)
+    assert not await verify_password("wrongpassword", hashed)
+
+
+@pytest.mark.asyncio
+async def test_bcrypt_hash_is_upgraded_on_verify():
+    old_hash = bcrypt.hash("secretpassword")
+    verified, new_hash = await verify_and_update_password("secretpassword", old_hash)
+    assert verified is True
+    assert new_hash is not None and new_hash.startswith("$argon2")
+
+    verified, new_hash = await verify_and_update_password("wrongpassword", old_hash)
+    assert verified is False
+    assert new_hash is None
+
+
+@pytest.mark.asyncio
+async def test_verified_tokens_are_cached_until_revoked():
+    token = create_access_token(data={"sub": "cached-user"})
+    payload = await decode_access_token(token)
+    assert payload["sub"] == "cached-user"
+    assert token_cache.get(token_digest(token)) == payload
+
+    await revoke_access_token(token)
+    assert token_cache.get(token_digest(token)) is None
+    # el token sigue siendo valido para jwt pero queda rechazado hasta que expire
+    with pytest.raises(jwt.InvalidTokenError):
+        await decode_access_token(token)
+    assert token_cache.get(token_digest(token)) is None
+    other = create_access_token(data={"sub": "cached-user"}, expires_delta=timedelta(minutes=5))
+    assert (await decode_access_token(other))["sub"] == "cached-user"
+
+
+def test_revocations_are_kept_until_the_token_expires():
+    revoked = RevokedTokens()
+    revoked.add("first", ttl=60)
+    # 1. Muchas revocaciones posteriores no desalojan la primera
+    for i in range(TOKEN_CACHE_SIZE + 1):
+        revoked.add(f"other-{i}", ttl=60)
+    assert "first" in revoked
+    # 2. Solo se olvidan al expirar el token
+    revoked.add("expired", ttl=0)
+    assert "expired" not in revoked
+    assert len(revoked) == TOKEN_CACHE_SIZE + 2
+
+
+@pytest.mark.asyncio
+async def test_expired_tokens_are_not_cached():
+    token = create_access_token(data={"sub": "expired-user"}, expires_delta=timedelta(minutes=-1))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        await decode_access_token(token)
+    assert token_cache.get(token_digest(token)) is None
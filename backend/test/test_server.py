@@ -0,0 +1,29 @@
+import pytest
+
+from app import server
+from app.server import pool_sizing
+
+
+def test_pool_sizing_splits_the_connection_budget_between_workers():
+    # 1. Nunca se supera el presupuesto total
+    for max_connections, workers in ((100, 8), (30, 4), (8, 8), (7, 3)):
+        pool_size, max_overflow = pool_sizing(max_connections, workers)
+        assert pool_size >= 1
+        assert (pool_size + max_overflow) * workers <= max_connections
+    assert pool_sizing(100, 8) == (8, 4)
+
+    # 2. Menos de una conexion por worker es un error de configuracion
+    with pytest.raises(ValueError):
+        pool_sizing(3, 4)
+
+
+def test_server_trusts_the_forwarded_headers_of_the_configured_proxies(monkeypatch):
+    runs = []
+    monkeypatch.setattr(server.uvicorn, "run", lambda app, **options: runs.append(options))
+    # 1. Por defecto solo el proxy local
+    server.main(["--workers", "1"])
+    assert runs[-1]["proxy_headers"] is True
+    assert runs[-1]["forwarded_allow_ips"] == "127.0.0.1"
+    # 2. El balanceador configurado fija la ip del cliente
+    server.main(["--workers", "1", "--forwarded-allow-ips", "10.0.0.0/8"])
+    assert runs[-1]["forwarded_allow_ips"] == "10.0.0.0/8"
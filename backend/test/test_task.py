@@ -1,6 +1,9 @@
+import csv
+import io
 import os
 import json
 
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 
 import pytest
@@ -8,8 +11,12 @@ import pytest
 from httpx import AsyncClient
 from fastapi import status
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 
+from app.core.cache import read_cache
 from app.core.config import SUPERUSER_PASSWORD, SUPERUSER_USERNAME
+from app.db.database import engine
+from app.db.tasks import task_cache_key, task_comments_cache_key
 from app.main import app
 # from app.main import app  # importa tu app principal de FastAPI
 
@@ -177,4 +184,790 @@ async def test_update_task():
     assert updated_task["title"] == "Updated Task"
     assert updated_task["description"] == "Descripción actualizada"
     assert updated_task["completed"] is True
-    assert updated_task["priority"] == "Low"
\ No newline at end of file
+    assert updated_task["priority"] == "Low"
+
+@pytest.mark.asyncio
+async def test_get_tasks_cursor_pagination():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Crear varias tareas
+    for i in range(5):
+        due_date = (datetime.now(timezone.utc) + timedelta(days=5 - i)).isoformat()
+        response = client.post(
+            "/tasks/",
+            headers=headers,
+            json={"title": f"Paged Task {i}", "due_date": due_date, "priority": "Medium"},
+        )
+        assert response.status_code == 200
+
+    # 2. Recorrer todas las paginas con el cursor
+    for sort_by, order in (("created_at", "asc"), ("due_date", "desc")):
+        seen = []
+        params = {"limit": 2, "sort_by": sort_by, "order": order}
+        while True:
+            response = client.get("/tasks/", headers=headers, params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 2
+            seen.extend(page)
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if next_cursor is None:
+                break
+            params["cursor"] = next_cursor
+
+        ids = [t["id"] for t in seen]
+        assert len(ids) == len(set(ids))
+        keys = [(t[sort_by], t["id"]) for t in seen]
+        assert keys == sorted(keys, reverse=(order == "desc"))
+
+    # 3. Un cursor invalido se rechaza
+    response = client.get("/tasks/", headers=headers, params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_create_task_with_unknown_priority():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    due_date = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    response = client.post(
+        "/tasks/",
+        headers=headers,
+        json={"title": "Bad priority", "due_date": due_date, "priority": "Urgent"},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "Priority not found"
+
+
+@pytest.mark.asyncio
+async def test_single_task_routes_reject_missing_and_null_required_fields():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Alta sin due_date: 422 como en el alta masiva, no un error del servidor
+    response = client.post("/tasks/", headers=headers, json={"title": "No due date", "priority": "Low"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"] == "due_date is required"
+
+    # 2. Un null explicito en una columna obligatoria tampoco llega a la base de datos
+    due_date = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    task_id = client.post(
+        "/tasks/", headers=headers, json={"title": "Required", "due_date": due_date, "priority": "Low"}).json()["id"]
+    for field in ("title", "completed", "due_date"):
+        response = client.put(f"/tasks/{task_id}", headers=headers, json={"id": task_id, field: None})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"] == f"{field} can not be null"
+    assert client.get(f"/tasks/{task_id}", headers=headers).json()["title"] == "Required"
+
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.asyncio
+async def test_task_endpoints_run_a_fixed_number_of_queries():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    payload = {"title": "Counted Task", "due_date": due_date, "priority": "Low"}
+    for _ in range(20):
+        assert client.post("/tasks/", headers=headers, json=payload).status_code == 200
+    # warm the principal cache and the priorities registry
+    assert client.get("/users/me/", headers=headers).status_code == 200
+
+    with count_queries() as statements:
+        response = client.get("/tasks/", headers=headers, params={"limit": 20})
+    assert response.status_code == 200
+    assert len(response.json()) == 20
+    assert all(t["priority"] is not None for t in response.json())
+    assert len(statements) == 1
+
+    # insert + statistics counter
+    with count_queries() as statements:
+        response = client.post("/tasks/", headers=headers, json=payload)
+    assert response.status_code == 200
+    assert response.json()["priority"] == "Low"
+    assert len(statements) == 2
+    task_id = response.json()["id"]
+
+    with count_queries() as statements:
+        response = client.get(f"/tasks/{task_id}", headers=headers)
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+    with count_queries() as statements:
+        response = client.put(f"/tasks/{task_id}", headers=headers, json={"id": task_id, "title": "Renamed"})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Renamed"
+    assert len(statements) == 1
+
+    # comments + task + statistics counter
+    with count_queries() as statements:
+        response = client.delete(f"/tasks/{task_id}", headers=headers)
+    assert response.status_code == 200
+    assert len(statements) == 3
+
+
+@pytest.mark.asyncio
+async def test_task_statistics_counts_and_breakdowns():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Crear tareas: una completada, una vencida y una pendiente
+    start = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
+    payloads = [
+        {"title": "Stats done", "due_date": (now + timedelta(days=1)).isoformat(), "completed": True, "priority": "High"},
+        {"title": "Stats overdue", "due_date": (now - timedelta(days=1)).isoformat(), "priority": "High"},
+        {"title": "Stats pending", "due_date": (now + timedelta(days=1)).isoformat(), "priority": "Low"},
+    ]
+    for payload in payloads:
+        assert client.post("/tasks/", headers=headers, json=payload).status_code == 200
+
+    # 2. Totales
+    response = client.get("/tasks/statistics", headers=headers, params={"created_at_start": start})
+    assert response.status_code == 200
+    detail = response.json()["detail"]
+    assert detail == {"completed": 1, "no_completed": 2, "total": 3, "overdue": 1}
+
+    # 3. Filtro por completed
+    response = client.get(
+        "/tasks/statistics", headers=headers, params={"created_at_start": start, "completed": False})
+    assert response.json()["detail"]["total"] == 2
+
+    # 4. Agrupado por prioridad y por dia
+    response = client.get(
+        "/tasks/statistics", headers=headers, params={"created_at_start": start, "group_by": "priority"})
+    assert response.status_code == 200
+    groups = {g["key"]: g for g in response.json()["groups"]}
+    assert groups["High"]["total"] == 2
+    assert groups["High"]["overdue"] == 1
+    assert groups["Low"]["total"] == 1
+
+    for group_by in ("day", "week", "created_by", "assigned_to"):
+        response = client.get(
+            "/tasks/statistics", headers=headers, params={"created_at_start": start, "group_by": group_by})
+        assert response.status_code == 200
+        assert sum(g["total"] for g in response.json()["groups"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_task_statistics_from_counters_match_tasks():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Crear, actualizar y eliminar tareas para mover los contadores
+    now = datetime.now(timezone.utc)
+    task_ids = []
+    for i in range(4):
+        response = client.post(
+            "/tasks/",
+            headers=headers,
+            json={"title": f"Counter {i}", "due_date": (now - timedelta(days=i - 1)).isoformat(), "priority": "Medium"},
+        )
+        assert response.status_code == 200
+        task_ids.append(response.json()["id"])
+    update_response = client.put(
+        f"/tasks/{task_ids[0]}", headers=headers, json={"id": task_ids[0], "completed": True, "priority": "High"})
+    assert update_response.status_code == 200
+    assert client.delete(f"/tasks/{task_ids[1]}", headers=headers).status_code == 200
+
+    # 2. Un dia completo se responde con los contadores, un instante con la tabla de tareas
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    from_counters = {"created_at_start": today.isoformat()}
+    from_tasks = {"created_at_start": (today + timedelta(microseconds=1)).isoformat()}
+    for group_by in (None, "priority", "day", "created_by"):
+        params = {"group_by": group_by} if group_by else {}
+        counters_response = client.get("/tasks/statistics", headers=headers, params={**from_counters, **params})
+        tasks_response = client.get("/tasks/statistics", headers=headers, params={**from_tasks, **params})
+        assert counters_response.status_code == 200
+        assert tasks_response.status_code == 200
+        assert counters_response.json() == tasks_response.json()
+
+
+@pytest.mark.asyncio
+async def test_task_reads_are_cached_until_written():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Crear tarea y calentar caches
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    response = client.post("/tasks/", headers=headers, json={"title": "Cached Task", "due_date": due_date, "priority": "Low"})
+    assert response.status_code == 200
+    task_id = response.json()["id"]
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 200
+    assert client.get(f"/tasks/{task_id}/comments/", headers=headers).json() == []
+
+    # 2. Las lecturas repetidas no tocan la base de datos
+    with count_queries() as statements:
+        response = client.get(f"/tasks/{task_id}", headers=headers)
+        comments_response = client.get(f"/tasks/{task_id}/comments/", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["title"] == "Cached Task"
+    assert comments_response.json() == []
+    assert len(statements) == 0
+
+    # 3. Escribir invalida la entrada
+    response = client.put(f"/tasks/{task_id}", headers=headers, json={"id": task_id, "title": "Renamed Cached Task"})
+    assert response.status_code == 200
+    assert client.get(f"/tasks/{task_id}", headers=headers).json()["title"] == "Renamed Cached Task"
+
+    response = client.post(f"/tasks/{task_id}/comments", headers=headers, json={"description": "first"})
+    assert response.status_code == 200
+    comments = client.get(f"/tasks/{task_id}/comments/", headers=headers).json()
+    assert [c["description"] for c in comments] == ["first"]
+
+    # 4. Borrar la tarea invalida tarea y comentarios
+    assert client.delete(f"/tasks/{task_id}", headers=headers).status_code == 200
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
+    assert client.get(f"/tasks/{task_id}/comments/", headers=headers).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_task_conditional_get_with_etag():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Crear tarea y leer su ETag
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    response = client.post("/tasks/", headers=headers, json={"title": "ETag Task", "due_date": due_date, "priority": "Low"})
+    assert response.status_code == 200
+    task_id = response.json()["id"]
+    response = client.get(f"/tasks/{task_id}", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # 2. Misma version: 304 sin cuerpo, tambien sin cache con un solo SELECT updated_at
+    response = client.get(f"/tasks/{task_id}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    await read_cache.delete(task_cache_key(task_id))
+    with count_queries() as statements:
+        response = client.get(f"/tasks/{task_id}", headers={**headers, "If-None-Match": f'W/{etag}'})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert len(statements) == 1
+
+    # 3. Tras modificar la tarea el ETag cambia
+    response = client.put(f"/tasks/{task_id}", headers=headers, json={"id": task_id, "title": "ETag Task 2"})
+    assert response.status_code == 200
+    response = client.get(f"/tasks/{task_id}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "ETag Task 2"
+    assert response.headers["ETag"] != etag
+
+    # 4. Lista de comentarios: cambia al crear y al editar un comentario
+    response = client.get(f"/tasks/{task_id}/comments/", headers=headers)
+    empty_etag = response.headers["ETag"]
+    response = client.post(f"/tasks/{task_id}/comments", headers=headers, json={"description": "first"})
+    comment_id = response.json()["id"]
+    response = client.get(f"/tasks/{task_id}/comments/", headers={**headers, "If-None-Match": empty_etag})
+    assert response.status_code == 200
+    comments_etag = response.headers["ETag"]
+    assert comments_etag != empty_etag
+
+    await read_cache.delete(task_comments_cache_key(task_id))
+    with count_queries() as statements:
+        response = client.get(f"/tasks/{task_id}/comments/", headers={**headers, "If-None-Match": comments_etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert len(statements) == 1
+
+    response = client.put(f"/tasks/{task_id}/comments/{comment_id}", headers=headers, json={"description": "edited"})
+    assert response.status_code == 200
+    response = client.get(f"/tasks/{task_id}/comments/", headers={**headers, "If-None-Match": comments_etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != comments_etag
+
+    # 5. Una tarea borrada no responde 304
+    assert client.delete(f"/tasks/{task_id}", headers=headers).status_code == 200
+    response = client.get(f"/tasks/{task_id}/comments/", headers={**headers, "If-None-Match": comments_etag})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_update_and_delete_tasks():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    assert client.get("/users/me/", headers=headers).status_code == 200
+
+    # 1. Alta masiva: los elementos invalidos se informan y no se insertan
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    tasks = [
+        {"title": f"Bulk Task {i}", "due_date": due_date, "priority": "Low"} for i in range(50)
+    ]
+    tasks.insert(10, {"title": "Bad Priority", "due_date": due_date, "priority": "Unknown"})
+    tasks.insert(20, {"title": "Bad Date", "due_date": "not a date", "priority": "Low"})
+    with count_queries() as statements:
+        response = client.post("/tasks/bulk", headers=headers, json=tasks)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 50
+    assert data["failed"] == 2
+    assert [r["index"] for r in data["results"]] == list(range(52))
+    assert data["results"][10]["status"] == 404
+    assert data["results"][10]["detail"] == "Priority not found"
+    assert data["results"][20]["status"] == 422
+    assert data["results"][0]["task"]["title"] == "Bulk Task 0"
+    assert data["results"][51]["task"]["title"] == "Bulk Task 49"
+    # no depende del numero de tareas (sqlite no garantiza el orden de RETURNING
+    # y sqlalchemy inserta fila a fila)
+    if engine.dialect.name == "postgresql":
+        assert len(statements) <= 5
+    ids = [r["id"] for r in data["results"] if r["status"] == 200]
+
+    # 2. Actualizacion masiva
+    updates = [{"id": task_id, "completed": True, "priority": "High"} for task_id in ids[:30]]
+    updates.append({"id": 0, "title": "missing"})
+    updates.append({"id": ids[0], "title": "duplicated"})
+    updates.extend({"id": ids[40], field: None} for field in ("title", "completed", "due_date"))
+    with count_queries() as statements:
+        response = client.patch("/tasks/bulk", headers=headers, json=updates)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 30
+    assert data["results"][30]["status"] == 404
+    assert data["results"][31]["status"] == 422
+    # un null explicito en una columna obligatoria es un 422, no un error del servidor
+    assert [r["status"] for r in data["results"][32:]] == [422, 422, 422]
+    assert data["results"][32]["detail"] == "title can not be null"
+    assert all(r["task"]["completed"] and r["task"]["priority"] == "High" for r in data["results"][:30])
+    assert len(statements) <= 8
+    response = client.get(f"/tasks/{ids[0]}", headers=headers)
+    assert response.json()["completed"] is True
+
+    # 3. Borrado masivo
+    with count_queries() as statements:
+        response = client.request("DELETE", "/tasks/bulk", headers=headers, json=ids + [0])
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 50
+    assert data["results"][-1]["status"] == 404
+    assert len(statements) <= 5
+    assert client.get(f"/tasks/{ids[0]}", headers=headers).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_export_tasks_as_ndjson_and_csv():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Crear tareas con un asignado propio para poder filtrarlas
+    user = client.post("/users/", headers=headers, json={
+        "username": "exporter", "email": "exporter@example.com", "phone": "555-0140", "password": "exporterpw",
+    }).json()
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    tasks = [
+        {"title": f"Export Task {i}", "due_date": due_date, "priority": "Low", "assigned_to": user["id"]}
+        for i in range(5)
+    ]
+    response = client.post("/tasks/bulk", headers=headers, json=tasks)
+    assert response.json()["succeeded"] == 5
+    first_id = response.json()["results"][0]["id"]
+    client.post(f"/tasks/{first_id}/comments", headers=headers, json={"description": "exported"})
+
+    # 2. NDJSON con comentarios
+    response = client.get("/tasks/export", headers=headers,
+                          params={"assigned_to": user["id"], "include_comments": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [t["title"] for t in lines] == [f"Export Task {i}" for i in range(5)]
+    assert [c["description"] for c in lines[0]["comments"]] == ["exported"]
+    assert lines[1]["comments"] == []
+
+    # 3. CSV en orden descendente
+    response = client.get("/tasks/export", headers=headers,
+                          params={"assigned_to": user["id"], "format": "csv", "order": "desc"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["title"] for r in rows] == [f"Export Task {i}" for i in reversed(range(5))]
+    assert rows[0]["priority"] == "Low"
+
+
+@pytest.mark.asyncio
+async def test_import_tasks_from_ndjson_and_csv():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    user = client.post("/users/", headers=headers, json={
+        "username": "importer", "email": "importer@example.com", "phone": "555-0150", "password": "importerpw",
+    }).json()
+
+    # 1. NDJSON: las lineas invalidas se informan con su numero
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    lines = [
+        json.dumps({"title": f"Imported {i}", "due_date": due_date, "priority": "Low", "assigned_to": user["id"]})
+        for i in range(30)
+    ]
+    lines.insert(5, "{not json")
+    lines.insert(8, json.dumps({"title": "No due date", "priority": None, "assigned_to": user["id"]}))
+    lines.insert(12, json.dumps({"title": "Bad priority", "due_date": due_date, "priority": "Unknown"}))
+    body = "\n".join(lines) + "\n"
+    response = client.post("/tasks/import", headers=headers, content=body.encode())
+    assert response.status_code == 200
+    data = response.json()
+    assert data["imported"] == 30
+    assert [(r["line"], r["detail"]) for r in data["rejected"]] == [
+        (6, "Invalid JSON"), (9, "due_date is required"), (13, "Priority not found"),
+    ]
+    assert data["rows_per_second"] > 0
+
+    # 2. CSV exportado y vuelto a importar, con saltos de linea entre comillas
+    response = client.get("/tasks/export", headers=headers, params={"assigned_to": user["id"], "format": "csv"})
+    csv_body = response.text.replace("\nImported 0,", '\n"Imported ""0""\nsecond line",', 1)
+    response = client.post("/tasks/import", headers=headers, params={"format": "csv"}, content=csv_body.encode())
+    assert response.status_code == 200
+    assert response.json()["imported"] == 30
+    assert response.json()["rejected"] == []
+
+    response = client.get("/tasks/export", headers=headers, params={"assigned_to": user["id"]})
+    titles = [json.loads(line)["title"] for line in response.text.splitlines()]
+    assert len(titles) == 60
+    assert 'Imported "0"\nsecond line' in titles
+
+    # 3. Los contadores de estadisticas incluyen las tareas importadas
+    response = client.get("/tasks/statistics", headers=headers, params={"assigned_to": user["id"]})
+    assert response.json()["detail"]["total"] == 60
+
+
+@pytest.mark.asyncio
+async def test_search_tasks_by_text():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 1. Tareas con el termino en el titulo, en la descripcion y en un comentario
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    tasks = [
+        {"title": f"Quokka migration {i}", "due_date": due_date, "priority": "Low"} for i in range(3)
+    ] + [
+        {"title": "Unrelated", "description": "the quokka database", "due_date": due_date, "priority": "Low"},
+        {"title": "Commented", "due_date": due_date, "priority": "Low"},
+    ]
+    ids = [r["id"] for r in client.post("/tasks/bulk", headers=headers, json=tasks).json()["results"]]
+    client.post(f"/tasks/{ids[4]}/comments", headers=headers, json={"description": "ask the quokka team"})
+
+    # 2. El titulo pesa mas que la descripcion, paginado con cursor
+    response = client.get("/tasks/search", headers=headers, params={"q": "quokka", "limit": 2})
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json()] == [ids[2], ids[1]]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/tasks/search", headers=headers, params={"q": "quokka", "limit": 2, "cursor": cursor})
+    assert [t["id"] for t in response.json()] == [ids[0], ids[3]]
+    assert "X-Next-Cursor" not in response.headers
+
+    # 3. Comentarios solo con include_comments y filtros existentes
+    response = client.get("/tasks/search", headers=headers, params={"q": "quokka", "include_comments": True})
+    assert ids[4] in [t["id"] for t in response.json()]
+    response = client.get("/tasks/search", headers=headers, params={"q": "quokka", "completed": True})
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_tasks_with_included_comments_and_users():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    me = client.get("/users/me/", headers=headers).json()
+    user = client.post("/users/", headers=headers, json={
+        "username": "boardviewer", "email": "boardviewer@example.com", "phone": "555-0180", "password": "boardpw",
+    }).json()
+
+    # 1. Tareas asignadas con comentarios
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    tasks = [
+        {"title": f"Board Task {i}", "due_date": due_date, "priority": "Low", "assigned_to": user["id"]}
+        for i in range(6)
+    ]
+    ids = [r["id"] for r in client.post("/tasks/bulk", headers=headers, json=tasks).json()["results"]]
+    for task_id in ids[:3]:
+        client.post(f"/tasks/{task_id}/comments", headers=headers, json={"description": f"note {task_id}"})
+
+    # 2. Sin include el documento no cambia
+    response = client.get("/tasks/", headers=headers, params={"assigned_to": user["id"]})
+    assert "comments" not in response.json()[0]
+    assert "assignee" not in response.json()[0]
+
+    # 3. Con include: numero fijo de consultas
+    with count_queries() as statements:
+        response = client.get("/tasks/", headers=headers, params={
+            "assigned_to": user["id"], "include": "comments,assignee,creator"})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 6
+    assert len(statements) == 3
+    assert [c["description"] for c in data[0]["comments"]] == [f"note {ids[0]}"]
+    assert data[5]["comments"] == []
+    assert data[0]["assignee"]["username"] == "boardviewer"
+    assert data[0]["creator"]["id"] == me["id"]
+    assert "hashed_password" not in data[0]["creator"]
+
+    # 4. Tarea individual e include invalido
+    response = client.get(f"/tasks/{ids[1]}", headers=headers, params={"include": "assignee"})
+    assert response.json()["assignee"]["id"] == user["id"]
+    assert "comments" not in response.json()
+    response = client.get(f"/tasks/{ids[1]}", headers=headers, params={"include": "owner"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_multi_get_tasks_and_users_by_ids():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    me = client.get("/users/me/", headers=headers).json()
+
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    tasks = [{"title": f"Multi Task {i}", "due_date": due_date, "priority": "Low"} for i in range(4)]
+    ids = [r["id"] for r in client.post("/tasks/bulk", headers=headers, json=tasks).json()["results"]]
+    # 1. Una tarea en cache, las demas desde la base de datos en una consulta
+    client.get(f"/tasks/{ids[1]}", headers=headers)
+
+    requested = [ids[3], 0, ids[1], ids[0], ids[3]]
+    with count_queries() as statements:
+        response = client.get("/tasks/by-ids", headers=headers, params={"ids": ",".join(map(str, requested))})
+    assert response.status_code == 200
+    data = response.json()
+    assert [t["id"] if t else None for t in data["results"]] == [ids[3], None, ids[1], ids[0], ids[3]]
+    assert data["missing"] == [0]
+    assert len(statements) == 1
+
+    # 2. Variante POST: solo falta ids[2], despues todo sale de la cache
+    with count_queries() as statements:
+        response = client.post("/tasks/by-ids", headers=headers, json=ids)
+    assert [t["title"] for t in response.json()["results"]] == [f"Multi Task {i}" for i in range(4)]
+    assert len(statements) == 1
+    with count_queries() as statements:
+        response = client.post("/tasks/by-ids", headers=headers, json=ids)
+    assert response.json()["missing"] == []
+    assert len(statements) == 0
+
+    # 3. Usuarios
+    response = client.get("/users/by-ids", headers=headers, params={"ids": f"{me['id']},0"})
+    assert response.status_code == 200
+    assert response.json()["results"][0]["username"] == SUPERUSER_USERNAME
+    assert response.json()["results"][1] is None
+    assert response.json()["missing"] == [0]
+    assert client.get("/users/by-ids", headers=headers, params={"ids": "1,x"}).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_sparse_fieldsets_on_task_and_comment_lists():
+    client = TestClient(app=app)
+
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+    user = client.post("/users/", headers=headers, json={
+        "username": "sparseviewer", "email": "sparseviewer@example.com", "phone": "555-0181", "password": "sparsepw",
+    }).json()
+
+    due_date = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    tasks = [
+        {"title": f"Sparse Task {i}", "description": "long text", "due_date": due_date,
+         "priority": "High", "assigned_to": user["id"]}
+        for i in range(3)
+    ]
+    ids = [r["id"] for r in client.post("/tasks/bulk", headers=headers, json=tasks).json()["results"]]
+
+    # 1. Solo las columnas y claves pedidas
+    params = {"assigned_to": user["id"], "fields": "id,title,priority", "limit": 2}
+    with count_queries() as statements:
+        response = client.get("/tasks/", headers=headers, params=params)
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": ids[0], "title": "Sparse Task 0", "priority": "High"},
+        {"id": ids[1], "title": "Sparse Task 1", "priority": "High"},
+    ]
+    assert len(statements) == 1
+    assert "description" not in statements[0]
+
+    # 2. El cursor sigue funcionando y se combina con include
+    params["cursor"] = response.headers["X-Next-Cursor"]
+    params["include"] = "assignee"
+    response = client.get("/tasks/", headers=headers, params=params)
+    assert response.json() == [{
+        "id": ids[2], "title": "Sparse Task 2", "priority": "High", "assignee": response.json()[0]["assignee"],
+    }]
+    assert response.json()[0]["assignee"]["username"] == "sparseviewer"
+    assert "X-Next-Cursor" not in response.headers
+
+    # 3. Busqueda y campos invalidos
+    response = client.get("/tasks/search", headers=headers, params={"q": "Sparse", "fields": "id,completed"})
+    assert sorted(response.json(), key=lambda t: t["id"]) == [{"id": id, "completed": False} for id in ids]
+    response = client.get("/tasks/", headers=headers, params={"fields": "id,hashed_password"})
+    assert response.status_code == 400
+
+    # 4. Comentarios: desde la base de datos y desde la pagina en cache
+    for i in range(3):
+        client.post(f"/tasks/{ids[0]}/comments", headers=headers, json={"description": f"sparse note {i}"})
+    with count_queries() as statements:
+        response = client.get(f"/tasks/{ids[0]}/comments/", headers=headers, params={"fields": "description", "limit": 2})
+    assert response.json() == [{"description": "sparse note 0"}, {"description": "sparse note 1"}]
+    assert "updated_at" not in statements[-1]
+    response = client.get(f"/tasks/{ids[0]}/comments/", headers=headers, params={
+        "fields": "description", "limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+    assert response.json() == [{"description": "sparse note 2"}]
+    client.get(f"/tasks/{ids[0]}/comments/", headers=headers)
+    response = client.get(f"/tasks/{ids[0]}/comments/", headers=headers, params={"fields": "id"})
+    assert len(response.json()) == 3
+    assert set(response.json()[0]) == {"id"}
+    assert "ETag" not in response.headers
@@ -105,3 +105,60 @@ async def test_superuser_task_comments_flow():
     print("confirmed_comment")
     print(json.dumps(confirmed_comment))
     assert confirmed_comment["description"] == "Updated second comment"
+
+
+@pytest.mark.asyncio
+async def test_task_comments_pagination_and_activity():
+    client = TestClient(app)
+    # 1. Login superuser
+    token_response = client.post(
+        "/token/",
+        data={
+            "username": SUPERUSER_USERNAME,
+            "password": SUPERUSER_PASSWORD,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert token_response.status_code == status.HTTP_200_OK
+    auth_header = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+    # 2. Crear una tarea con 7 comentarios
+    due_date = (datetime.now(timezone.utc) + timedelta(days=3)).isoformat()
+    task_response = client.post("/tasks/", headers=auth_header, json={
+        "title": "Busy task", "due_date": due_date, "priority": "Low",
+    })
+    task_id = task_response.json()["id"]
+    assert task_response.json()["comment_count"] == 0
+    assert task_response.json()["last_comment_at"] is None
+    comment_ids = [
+        client.post(f"/tasks/{task_id}/comments", headers=auth_header, json={"description": f"comment {i}"}).json()["id"]
+        for i in range(7)
+    ]
+
+    # 3. La tarea refleja la actividad
+    task = client.get(f"/tasks/{task_id}", headers=auth_header).json()
+    assert task["comment_count"] == 7
+    assert task["last_comment_at"] is not None
+
+    # 4. Recorrer las paginas con el cursor
+    seen = []
+    params = {"limit": 3}
+    while True:
+        response = client.get(f"/tasks/{task_id}/comments/", headers=auth_header, params=params)
+        assert response.status_code == 200
+        assert len(response.json()) <= 3
+        seen += [c["id"] for c in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 3, "cursor": response.headers["X-Next-Cursor"]}
+    assert seen == comment_ids
+
+    # 5. Borrar comentarios actualiza el contador
+    client.delete(f"/tasks/{task_id}/comments/{comment_ids[-1]}", headers=auth_header)
+    task = client.get(f"/tasks/{task_id}", headers=auth_header).json()
+    assert task["comment_count"] == 6
+    for comment_id in comment_ids[:-1]:
+        client.delete(f"/tasks/{task_id}/comments/{comment_id}", headers=auth_header)
+    task = client.get(f"/tasks/{task_id}", headers=auth_header).json()
+    assert task["comment_count"] == 0
+    assert task["last_comment_at"] is None
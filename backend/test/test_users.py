@@ -166,6 +166,16 @@ async def test_update_user():
     assert "password" not in updated_user
     assert "hashed_password" not in updated_user
 
+    # 5. El ETag de la lectura anterior ya no vale
+    etag = read_response.headers["ETag"]
+    reread_response = client.get(f"/users/{user_id}", headers={**headers, "If-None-Match": etag})
+    assert reread_response.status_code == 200
+    assert reread_response.json()["full_name"] == "Bob The Builder"
+    new_etag = reread_response.headers["ETag"]
+    assert new_etag != etag
+    not_modified = client.get(f"/users/{user_id}", headers={**headers, "If-None-Match": new_etag})
+    assert not_modified.status_code == 304
+
 
 @pytest.mark.asyncio
 async def test_non_admin_cannot_access_user_list():
@@ -215,3 +225,49 @@ async def test_non_admin_cannot_access_user_list():
     assert "Not enough permissions" in body["detail"] or "forbidden" in body["detail"].lower()
 
 
+
+
+@pytest.mark.asyncio
+async def test_disabled_user_is_rejected_immediately():
+    client = TestClient(app=app)
+
+    # 1. Login superuser
+    login_response = client.post(
+        "/token/",
+        data={"username": SUPERUSER_USERNAME, "password": SUPERUSER_PASSWORD},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert login_response.status_code == 200
+    super_headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    # 2. Crear usuario y hacer login
+    new_user = {
+        "username": "dave",
+        "email": "dave@example.com",
+        "full_name": "Dave Cached",
+        "phone": "555555",
+        "password": "davepassword",
+    }
+    create_response = client.post("/users/", json=new_user, headers=super_headers)
+    assert create_response.status_code == 200
+    user_id = create_response.json()["id"]
+
+    login_user_response = client.post(
+        "/token/",
+        data={"username": "dave", "password": "davepassword"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert login_user_response.status_code == 200
+    user_headers = {"Authorization": f"Bearer {login_user_response.json()['access_token']}"}
+
+    # 3. El usuario queda en la cache de usuarios autenticados
+    assert client.get("/users/me/", headers=user_headers).status_code == 200
+    assert client.get("/users/me/", headers=user_headers).status_code == 200
+
+    # 4. Deshabilitar el usuario invalida la cache
+    update_response = client.put(f"/users/{user_id}", json={"enabled": False}, headers=super_headers)
+    assert update_response.status_code == 200
+
+    response = client.get("/users/me/", headers=user_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Inactive user"